@@ -0,0 +1,81 @@
+# Размер порций по объёму данных, а не по числу строк.
+# В таблицах с MEDIUMTEXT/LONGTEXT (например, webform_submission_data) 10000 строк могут занимать
+# и 5 МБ, и 5 ГБ: фиксированное число строк либо даёт лишние обращения к базам, либо переполняет
+# память и max_allowed_packet. Порция набирается до бюджета в байтах, бюджет подстраивается под
+# время записи последних порций, а строки с очень большими значениями переносятся отдельными
+# порциями, чтобы не раздувать остальные.
+
+from metrics import estimate_bytes
+
+# Сглаживание оценки среднего размера строки по последним порциям
+_ALPHA = 0.3
+# Во сколько раз бюджет растёт после быстрой записи (до заданного максимума)
+_GROWTH = 1.5
+
+class AdaptiveBatcher:
+    """Нарезает поток строк на порции не больше текущего бюджета байт и max_rows строк.
+
+    Бюджет начинается с byte_budget; если запись порции заняла больше target_latency секунд,
+    он уменьшается пропорционально превышению (но не ниже min_rows строк среднего размера),
+    а после быстрых записей снова растёт до byte_budget. Строка объёмом от large_value байт
+    (по умолчанию четверть бюджета) всегда образует отдельную порцию: COPY передаёт её
+    потоком блоками, а соседние строки переносятся обычными порциями. Бюджет ограничивает
+    только набор порции: строка, которая больше бюджета, уже прочитана драйвером целиком
+    и так и остаётся в памяти целиком, пока её порция не записана.
+    """
+
+    def __init__(self, byte_budget, max_rows=10000, min_rows=100, large_value=None, target_latency=0.0):
+        self.byte_budget = byte_budget
+        self.budget = byte_budget
+        self.max_rows = max_rows
+        self.min_rows = min(min_rows, max_rows)
+        self.large_value = large_value or byte_budget // 4
+        self.target_latency = target_latency
+        self.row_bytes = None
+        self.large_rows = 0
+
+    def limit(self):
+        """Сколько строк запрашивать одним запросом: бюджет, делённый на средний размер строки.
+        Пока размер строк неизвестен, первая выборка ограничена min_rows строками."""
+        if self.row_bytes is None:
+            return self.min_rows
+        return max(self.min_rows, min(self.max_rows, int(self.budget / max(self.row_bytes, 1))))
+
+    def _observe(self, rows, size):
+        if rows:
+            average = size / len(rows)
+            self.row_bytes = average if self.row_bytes is None else (
+                _ALPHA * average + (1 - _ALPHA) * self.row_bytes)
+
+    def batches(self, rows):
+        """Генератор порций (списков строк) из итератора строк в исходном порядке."""
+        batch, size = [], 0
+        for row in rows:
+            row_size = estimate_bytes((row,))
+            if row_size >= self.large_value:
+                if batch:
+                    self._observe(batch, size)
+                    yield batch
+                    batch, size = [], 0
+                self.large_rows += 1
+                yield [row]
+                continue
+            batch.append(row)
+            size += row_size
+            if size >= self.budget or len(batch) >= self.max_rows:
+                self._observe(batch, size)
+                yield batch
+                batch, size = [], 0
+        if batch:
+            self._observe(batch, size)
+            yield batch
+
+    def record_write(self, rows, elapsed):
+        """Учитывает время записи порции и пересчитывает бюджет следующих порций."""
+        if not self.target_latency or len(rows) <= 1:
+            return
+        if elapsed > self.target_latency:
+            floor = self.min_rows * (self.row_bytes or 1)
+            self.budget = max(floor, self.budget * self.target_latency / elapsed)
+        else:
+            self.budget = min(self.byte_budget, self.budget * _GROWTH)
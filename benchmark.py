@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# Бенчмарк скриптов переноса на синтетических данных webform_submission_data.
+# Источник — SQLite во временном каталоге (или MySQL/MariaDB по --mysql), приёмник — временный
+# экземпляр PostgreSQL (пакет pgserver) или база по --postgres. Все таблицы бенчмарка в ней пересоздаются.
+# Запуск с сохранением результатов как базовой линии:
+# python benchmark.py --submissions 20000 --save-baseline benchmark_baseline.json
+# Сравнение с базовой линией (код возврата 1 при регрессии):
+# python benchmark.py --submissions 20000 --baseline benchmark_baseline.json
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from sqlalchemy import text
+
+from generate_webform_data import generate
+from connections import make_engine
+
+try:
+    from tabulate import tabulate
+except ImportError:
+    tabulate = None
+
+try:
+    import pgserver
+except ImportError:
+    pgserver = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+STEPS = ["migrate_db", "migrate_webform", "sync", "compare_keys", "compare_row_counts"]
+TABLE = "webform_submission_data"
+
+def step_command(step, mysql_url, pg_url, metrics_path):
+    """Команда запуска шага бенчмарка."""
+    common = ["--mysql", mysql_url, "--postgres", pg_url]
+    metrics = ["--metrics-jsonl", metrics_path]
+    commands = {
+        "migrate_db": ["migrate_db.py", *common, "--table", TABLE, "--table", "webform_submission", *metrics],
+        "migrate_webform": ["migrate_webform_submission_data.py", *common, "--drop", *metrics],
+        "sync": ["sync_webform_submission_data.py", *common, "--key", "sid", *metrics],
+        "compare_keys": ["compare_keys.py", *common, "--key", "sid,name,property,delta"],
+        "compare_row_counts": ["compare_row_counts.py", *common, "--exact", "all"],
+    }
+    script, *arguments = commands[step]
+    return [sys.executable, os.path.join(HERE, script), *arguments]
+
+def prepare_step(step, pg_url, sync_fraction):
+    """Подготовка перед шагом: для sync из PostgreSQL удаляются отправки с sid, кратным
+    1 / sync_fraction, чтобы синхронизации было что переносить."""
+    if step != "sync":
+        return
+    modulus = max(int(round(1 / sync_fraction)), 1)
+    engine = make_engine(pg_url)
+    with engine.begin() as conn:
+        conn.execute(text(f"DELETE FROM {TABLE} WHERE sid % :modulus = 0"), {"modulus": modulus})
+    engine.dispose()
+
+def run_step(command, log_path):
+    """Запускает шаг отдельным процессом. Возвращает (код возврата, время в секундах,
+    пиковая память процесса в байтах или None)."""
+    started = time.monotonic()
+    with open(log_path, "w", encoding="utf-8") as log:
+        process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT, cwd=HERE)
+        if hasattr(os, "wait4"):
+            # wait4 возвращает ресурсы именно этого процесса, а не всех дочерних вместе
+            _, status, usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            peak = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+        else:
+            process.wait()
+            peak = None
+    return process.returncode, time.monotonic() - started, peak
+
+def read_metrics(path, offset):
+    """Записи метрик, дописанные в файл JSON Lines после позиции offset."""
+    if not os.path.exists(path):
+        return [], offset
+    with open(path, encoding="utf-8") as f:
+        f.seek(offset)
+        records = [json.loads(line) for line in f if line.strip()]
+        return records, f.tell()
+
+def start_postgres(workdir):
+    """Запускает временный экземпляр PostgreSQL в workdir. Возвращает (сервер, строка подключения)."""
+    if pgserver is None:
+        sys.exit("Не задан --postgres, а пакет pgserver для временного PostgreSQL не установлен.")
+    server = pgserver.get_server(os.path.join(workdir, "pgdata"), cleanup_mode="stop")
+    return server, server.get_uri().replace("postgresql://", "postgresql+psycopg2://", 1)
+
+def run_benchmark(args, workdir, pg_url):
+    """Генерирует данные и выполняет шаги. Возвращает словарь результатов для отчёта и базовой линии."""
+    mysql_url = args.mysql or f"sqlite:///{os.path.join(workdir, 'source.db')}"
+    print(f"Источник: {mysql_url}\nПриёмник: {pg_url}")
+
+    print(f"Генерируем данные: {args.submissions} отправок, seed {args.seed}...")
+    dataset = generate(make_engine(mysql_url), args.submissions, args.seed, args.large_ratio,
+                       args.nul_ratio, args.max_value_size, log=lambda *a: None)
+    print(f"Строк: {dataset['rows']}, значений: {dataset['bytes'] / 2**20:.1f} МБ")
+
+    metrics_path = os.path.join(workdir, "metrics.jsonl")
+    offset = 0
+    steps = {}
+    for step in args.steps:
+        prepare_step(step, pg_url, args.sync_fraction)
+        log_path = os.path.join(workdir, f"{step}.log")
+        code, elapsed, peak = run_step(step_command(step, mysql_url, pg_url, metrics_path), log_path)
+        records, offset = read_metrics(metrics_path, offset)
+        # Для шагов с метриками — перенесённые строки и байты, для сравнений — строки источника
+        rows = sum(record["rows"] for record in records) if records else dataset["rows"]
+        data_bytes = sum(record["bytes"] for record in records) if records else dataset["bytes"]
+        steps[step] = {
+            "ok": code == 0,
+            "elapsed": round(elapsed, 3),
+            "rows": rows,
+            "rows_per_second": round(rows / elapsed, 1) if elapsed > 0 else 0.0,
+            "bytes_per_second": round(data_bytes / elapsed, 1) if elapsed > 0 else 0.0,
+            "peak_rss_bytes": peak,
+            "stages": {name: round(sum(record["stages"].get(name, 0.0) for record in records), 3)
+                       for name in sorted({name for record in records for name in record["stages"]})},
+        }
+        state = "готово" if code == 0 else f"ошибка (код {code}), журнал: {log_path}"
+        print(f"{step}: {elapsed:.1f} с, {steps[step]['rows_per_second']:.0f} строк/с — {state}")
+    return {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "host": {"python": platform.python_version(), "platform": platform.platform()},
+        "dataset": dataset,
+        "steps": steps,
+    }
+
+def compare_with_baseline(results, baseline, tolerance):
+    """Сравнивает скорость шагов с базовой линией. Возвращает список строк отчёта
+    (шаг, строк/с, строк/с в базовой линии, отношение, статус) и признак регрессии."""
+    if baseline.get("dataset", {}).get("rows") != results["dataset"]["rows"]:
+        print("Внимание: набор данных отличается от базовой линии, сравнение приблизительное.")
+    rows = []
+    regression = False
+    for step, result in results["steps"].items():
+        base = baseline.get("steps", {}).get(step)
+        if not base or not base.get("rows_per_second"):
+            rows.append([step, f"{result['rows_per_second']:.0f}", "—", "—", "нет в базовой линии"])
+            continue
+        ratio = result["rows_per_second"] / base["rows_per_second"]
+        status = "регрессия" if ratio < 1 - tolerance else ("ускорение" if ratio > 1 + tolerance else "норма")
+        regression = regression or status == "регрессия" or not result["ok"]
+        rows.append([step, f"{result['rows_per_second']:.0f}", f"{base['rows_per_second']:.0f}",
+                     f"{ratio:.2f}", status])
+    return rows, regression
+
+def print_table(output_data, headers):
+    if tabulate:
+        print(tabulate(output_data, headers=headers, tablefmt="psql"))
+    else:
+        print(("{:<20} " * len(headers)).format(*headers))
+        for row in output_data:
+            print(("{:<20} " * len(row)).format(*[str(value) for value in row]))
+
+def print_report(results):
+    output_data = []
+    for step, result in results["steps"].items():
+        peak = result["peak_rss_bytes"]
+        stages = ", ".join(f"{name} {value:.1f}" for name, value in result["stages"].items())
+        output_data.append([step, "да" if result["ok"] else "нет", f"{result['elapsed']:.1f}", result["rows"],
+                            f"{result['rows_per_second']:.0f}", f"{result['bytes_per_second'] / 2**20:.2f}",
+                            f"{peak / 2**20:.0f}" if peak else "—", stages or "—"])
+    headers = ["Шаг", "Успешно", "Время, с", "Строк", "Строк/с", "МБ/с", "Пиковая память, МБ", "Стадии, с"]
+    print()
+    print_table(output_data, headers)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Бенчмарк переноса, синхронизации и сравнения на синтетических данных webform_submission_data."
+    )
+    parser.add_argument("--mysql", type=str, default=None,
+                        help="Строка подключения к источнику; таблицы бенчмарка в нём пересоздаются "
+                             "(по умолчанию: SQLite во временном каталоге)")
+    parser.add_argument("--postgres", type=str, default=None,
+                        help="Строка подключения к PostgreSQL; таблицы бенчмарка в нём пересоздаются "
+                             "(по умолчанию: временный экземпляр через pgserver)")
+    parser.add_argument("--submissions", type=int, default=5000,
+                        help="Количество отправок в синтетическом наборе (по умолчанию: 5000)")
+    parser.add_argument("--seed", type=int, default=42,
+                        help="Начальное значение генератора данных (по умолчанию: 42)")
+    parser.add_argument("--large-ratio", type=float, default=0.01,
+                        help="Доля больших значений (по умолчанию: 0.01)")
+    parser.add_argument("--nul-ratio", type=float, default=0.02,
+                        help="Доля значений со встроенными NUL-символами (по умолчанию: 0.02)")
+    parser.add_argument("--max-value-size", type=int, default=1 << 20,
+                        help="Максимальный размер большого значения в символах (по умолчанию: 1048576)")
+    parser.add_argument("--steps", nargs="+", choices=STEPS, default=STEPS,
+                        help=f"Выполняемые шаги (по умолчанию: {' '.join(STEPS)})")
+    parser.add_argument("--sync-fraction", type=float, default=0.1,
+                        help="Доля отправок, удаляемых из PostgreSQL перед шагом sync (по умолчанию: 0.1)")
+    parser.add_argument("--baseline", type=str, default=None,
+                        help="Файл базовой линии для сравнения (по умолчанию: не сравнивать)")
+    parser.add_argument("--save-baseline", type=str, default=None,
+                        help="Сохранить результаты как базовую линию в указанный файл (по умолчанию: не сохранять)")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="Допустимое замедление относительно базовой линии (по умолчанию: 0.15 — 15%%)")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Записать результаты в JSON-файл (по умолчанию: не записывать)")
+    parser.add_argument("--keep", action="store_true",
+                        help="Не удалять временный каталог с данными и журналами шагов")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="webform_bench_")
+    server = None
+    try:
+        pg_url = args.postgres
+        if pg_url is None:
+            server, pg_url = start_postgres(workdir)
+        results = run_benchmark(args, workdir, pg_url)
+    finally:
+        if server is not None:
+            server.cleanup()
+        if args.keep:
+            print(f"Временный каталог сохранён: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    print_report(results)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+            print(f"Результаты записаны в {path}")
+
+    failed = not all(result["ok"] for result in results["steps"].values())
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows, regression = compare_with_baseline(results, baseline, args.tolerance)
+        print(f"\nСравнение с базовой линией {args.baseline} (допуск {args.tolerance:.0%}):")
+        print_table(rows, ["Шаг", "Строк/с", "Базовая линия", "Отношение", "Статус"])
+        failed = failed or regression
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# Журнал контрольных точек переноса в управляющей таблице PostgreSQL.
+# Запись о порции делается в той же транзакции, что и сама порция, поэтому после сбоя
+# журнал никогда не опережает и не отстаёт от данных: --resume продолжает с последнего
+# зафиксированного ключа, ничего не читая и не записывая повторно.
+# Там же хранятся отметки (watermark) инкрементальной синхронизации.
+
+import json
+
+from sqlalchemy import (Boolean, BigInteger, Column, DateTime, Float, MetaData, Table, Text,
+                        delete, func, select)
+from sqlalchemy.dialects.postgresql import insert
+
+CHECKPOINT_TABLE = "migration_checkpoint"
+WATERMARK_TABLE = "sync_watermark"
+
+_metadata = MetaData()
+checkpoints = Table(
+    CHECKPOINT_TABLE, _metadata,
+    Column("table_name", Text, primary_key=True),
+    # Пустая строка — таблица целиком, иначе — диапазон шарда
+    Column("shard", Text, primary_key=True, default=""),
+    Column("shard_range", Text),
+    Column("last_key", Text),
+    Column("rows_copied", BigInteger, nullable=False, default=0),
+    Column("elapsed", Float, nullable=False, default=0.0),
+    Column("completed", Boolean, nullable=False, default=False),
+    Column("updated_at", DateTime(timezone=True), nullable=False, server_default=func.now()),
+)
+
+watermarks = Table(
+    WATERMARK_TABLE, _metadata,
+    Column("table_name", Text, primary_key=True),
+    Column("watermark_column", Text, primary_key=True),
+    Column("watermark", Text),
+    Column("rows_synced", BigInteger, nullable=False, default=0),
+    Column("updated_at", DateTime(timezone=True), nullable=False, server_default=func.now()),
+)
+
+def ensure_checkpoint_table(engine):
+    """Создаёт управляющую таблицу журнала в PostgreSQL, если её ещё нет."""
+    _metadata.create_all(engine, tables=[checkpoints], checkfirst=True)
+
+def ensure_watermark_table(engine):
+    """Создаёт управляющую таблицу отметок инкрементальной синхронизации, если её ещё нет."""
+    _metadata.create_all(engine, tables=[watermarks], checkfirst=True)
+
+def encode_key(key):
+    """Кодирует значение ключа (кортеж) в JSON; значения без JSON-типа сохраняются строкой."""
+    return None if key is None else json.dumps(list(key), default=str, ensure_ascii=False)
+
+def decode_key(value):
+    return None if value is None else tuple(json.loads(value))
+
+def load_checkpoint(conn, table, shard=""):
+    """Возвращает последнюю контрольную точку таблицы (шарда) в виде словаря
+    {"last_key", "rows", "elapsed", "completed"} или None, если записи нет."""
+    row = conn.execute(
+        select(checkpoints).where(checkpoints.c.table_name == table, checkpoints.c.shard == shard)
+    ).mappings().first()
+    if row is None:
+        return None
+    return {"last_key": decode_key(row["last_key"]), "rows": row["rows_copied"],
+            "elapsed": row["elapsed"], "completed": row["completed"]}
+
+def save_checkpoint(conn, table, last_key, rows, elapsed, shard="", completed=False):
+    """Записывает контрольную точку в текущей транзакции conn (вместе с порцией данных)."""
+    values = {"last_key": encode_key(last_key), "rows_copied": rows, "elapsed": elapsed,
+              "completed": completed, "updated_at": func.now()}
+    statement = insert(checkpoints).values(table_name=table, shard=shard, **values)
+    conn.execute(statement.on_conflict_do_update(index_elements=["table_name", "shard"], set_=values))
+
+def register_shards(conn, table, shards):
+    """Сохраняет план разбиения таблицы: shards — словарь {метка шарда: (lo, hi)}.
+    При --resume шарды берутся из журнала, так как границы, вычисленные заново, могли сдвинуться."""
+    for label, (lo, hi) in shards.items():
+        conn.execute(insert(checkpoints).values(
+            table_name=table, shard=label, shard_range=json.dumps([lo, hi], default=str),
+            rows_copied=0, elapsed=0.0, completed=False,
+        ).on_conflict_do_nothing())
+
+def load_shards(conn, table):
+    """Возвращает сохранённый план разбиения таблицы {метка шарда: (lo, hi)} (пустой, если его нет)."""
+    rows = conn.execute(
+        select(checkpoints.c.shard, checkpoints.c.shard_range)
+        .where(checkpoints.c.table_name == table, checkpoints.c.shard != "")
+        .order_by(checkpoints.c.shard_range)
+    )
+    return {shard: tuple(json.loads(shard_range)) for shard, shard_range in rows if shard_range}
+
+def has_checkpoints(conn, table):
+    """True, если в журнале есть записи о таблице (целиком или по шардам)."""
+    return conn.execute(
+        select(checkpoints.c.table_name).where(checkpoints.c.table_name == table).limit(1)
+    ).first() is not None
+
+def copied_rows(conn, table):
+    """Количество строк таблицы, перенесённых по журналу (сумма по всем шардам)."""
+    return conn.execute(
+        select(func.coalesce(func.sum(checkpoints.c.rows_copied), 0)).where(checkpoints.c.table_name == table)
+    ).scalar()
+
+def clear_checkpoints(conn, table):
+    """Удаляет журнал таблицы перед переносом с нуля."""
+    conn.execute(delete(checkpoints).where(checkpoints.c.table_name == table))
+
+def load_watermark(conn, table, watermark_column):
+    """Возвращает сохранённое значение отметки для таблицы и столбца или None, если синхронизаций ещё не было."""
+    value = conn.execute(
+        select(watermarks.c.watermark)
+        .where(watermarks.c.table_name == table, watermarks.c.watermark_column == watermark_column)
+    ).scalar()
+    return None if value is None else json.loads(value)
+
+def save_watermark(conn, table, watermark_column, value, rows):
+    """Записывает отметку в текущей транзакции conn (вместе с применённой порцией изменений)."""
+    values = {"watermark": json.dumps(value, default=str), "rows_synced": rows, "updated_at": func.now()}
+    statement = insert(watermarks).values(table_name=table, watermark_column=watermark_column, **values)
+    conn.execute(statement.on_conflict_do_update(index_elements=["table_name", "watermark_column"], set_=values))
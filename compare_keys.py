@@ -1,12 +1,37 @@
 #!/usr/bin/env python3
 import argparse
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+from key_diff import KeyDiff, MISSING
+from connections import make_engine, with_reconnect
 
 def get_row_count(engine, table):
-    with engine.connect() as conn:
-        query = text(f"SELECT COUNT(*) AS count FROM {table}")
-        result = conn.execute(query).mappings().one()
-        return result["count"]
+    query = text(f"SELECT COUNT(*) AS count FROM {table}")
+
+    def count():
+        with engine.connect() as conn:
+            return conn.execute(query).mappings().one()["count"]
+
+    return with_reconnect(count)
+
+def format_key(key):
+    """Представляет ключ для вывода: одиночное значение без скобок, составной ключ — кортежем."""
+    return str(key[0]) if len(key) == 1 else str(key)
+
+def compare_keys(mysql_engine, pg_engine, table, key_columns, max_print):
+    """Потоково сравнивает ключи таблицы в MySQL и PostgreSQL и выводит расхождения по мере обнаружения."""
+    diff = KeyDiff(mysql_engine, pg_engine, table, key_columns)
+    printed = 0
+    for kind, key in diff:
+        if printed < max_print:
+            label = "Нет в PostgreSQL" if kind == MISSING else "Нет в MySQL"
+            print(f"{label}: {format_key(key)}")
+            printed += 1
+            if printed == max_print:
+                print(f"... вывод ограничен {max_print} ключами, подсчёт продолжается")
+    print(f"\nКлючей в MySQL: {diff.source_count}, в PostgreSQL: {diff.target_count}")
+    print(f"Нет в PostgreSQL: {diff.missing_count}, нет в MySQL: {diff.extra_count}")
+    if not diff.missing_count and not diff.extra_count:
+        print("Наборы ключей совпадают.")
 
 def main():
     parser = argparse.ArgumentParser(
@@ -30,10 +55,28 @@ def main():
         default="postgresql+psycopg2://postgres@localhost/hexly_proj",
         help="Строка подключения к PostgreSQL (по умолчанию: postgresql+psycopg2://postgres@localhost/hexly_proj)"
     )
+    parser.add_argument(
+        "--key",
+        type=str,
+        default=None,
+        help="Столбец ключа (или несколько через запятую) для потокового сравнения наборов ключей вместо подсчёта строк"
+    )
+    parser.add_argument(
+        "--max-print",
+        type=int,
+        default=100,
+        help="Сколько расходящихся ключей выводить при сравнении по --key (по умолчанию: 100)"
+    )
     args = parser.parse_args()
 
-    mysql_engine = create_engine(args.mysql)
-    pg_engine = create_engine(args.postgres)
+    mysql_engine = make_engine(args.mysql)
+    pg_engine = make_engine(args.postgres)
+
+    if args.key:
+        key_columns = [name.strip() for name in args.key.split(",")]
+        print(f"Сравниваем ключи ({', '.join(key_columns)}) таблицы '{args.table}' в MySQL и PostgreSQL...")
+        compare_keys(mysql_engine, pg_engine, args.table, key_columns, args.max_print)
+        return
 
     print(f"Получаем общее количество строк в таблице '{args.table}' в MySQL...")
     mysql_count = get_row_count(mysql_engine, args.table)
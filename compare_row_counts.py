@@ -1,46 +1,130 @@
 #!/usr/bin/env python3
+# Сравнение количества строк во всех таблицах: сначала мгновенные оценки из статистики СУБД,
+# затем точный COUNT(*) только для таблиц, оценки которых расходятся:
+# python compare_row_counts.py
+# Точный подсчёт всех таблиц в 8 потоков на каждую базу:
+# python compare_row_counts.py --exact all --workers 8
 import argparse
-from sqlalchemy import create_engine, text
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import inspect, text, select, func, table as sql_table, column
+from key_ranges import get_key_columns, plan_key_ranges, range_condition, describe_range
+from connections import make_engine, with_reconnect
+from checkpoint import CHECKPOINT_TABLE, WATERMARK_TABLE
 try:
     from tabulate import tabulate
 except ImportError:
     tabulate = None
 
-def get_mysql_table_counts(mysql_conn_str):
-    """Подключается к MySQL и возвращает словарь {table_name: row_count} для всех таблиц."""
-    engine = create_engine(mysql_conn_str)
-    counts = {}
+CONTROL_TABLES = {CHECKPOINT_TABLE, WATERMARK_TABLE}
+
+def get_mysql_estimates(engine):
+    """Возвращает словарь {table_name: оценка числа строк} для всех таблиц MySQL.
+    Оценка берётся из information_schema.TABLES.TABLE_ROWS (статистика InnoDB, без чтения таблиц);
+    для других СУБД (например, SQLite) оценок нет, и значения равны None."""
+    if engine.dialect.name != "mysql":
+        return {table: None for table in inspect(engine).get_table_names()}
+    query = text("""
+        SELECT TABLE_NAME, TABLE_ROWS
+        FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_TYPE = 'BASE TABLE'
+    """)
     with engine.connect() as conn:
-        # Получаем список таблиц
-        result = conn.execute(text("SHOW TABLES"))
-        tables = [row[0] for row in result]
-        for table in tables:
-            try:
-                count = conn.execute(text(f"SELECT COUNT(*) FROM `{table}`")).scalar()
-                counts[table] = count
-            except Exception as e:
-                counts[table] = f"Error: {e}"
-    return counts
+        return {row[0]: row[1] for row in conn.execute(query)}
 
-def get_postgres_table_counts(pg_conn_str):
-    """Подключается к PostgreSQL и возвращает словарь {table_name: row_count} для таблиц в схеме public."""
-    engine = create_engine(pg_conn_str)
-    counts = {}
+def get_postgres_estimates(engine):
+    """Возвращает словарь {table_name: оценка числа строк} для таблиц схемы public по pg_class.reltuples.
+    Для таблиц, по которым ещё не собиралась статистика (reltuples = -1), оценка равна None.
+    Служебные таблицы миграции (журнал контрольных точек и отметки синхронизации) не учитываются."""
+    query = text("""
+        SELECT c.relname, c.reltuples::bigint
+        FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p')
+    """)
     with engine.connect() as conn:
-        # Получаем список таблиц в схеме public
-        result = conn.execute(text("SELECT table_name FROM information_schema.tables WHERE table_schema = 'public'"))
-        tables = [row[0] for row in result]
+        return {row[0]: (row[1] if row[1] >= 0 else None) for row in conn.execute(query)
+                if row[0] not in CONTROL_TABLES}
+
+def estimates_diverge(mysql_estimate, pg_estimate, tolerance):
+    """True, если оценки расходятся больше чем на долю tolerance или хотя бы одной из них нет."""
+    if mysql_estimate is None or pg_estimate is None:
+        return True
+    return abs(mysql_estimate - pg_estimate) > tolerance * max(mysql_estimate, pg_estimate, 1)
+
+def plan_count_ranges(engine, table, estimate, split_rows, shards):
+    """Диапазоны ключа для подсчёта крупной таблицы по частям: [(столбец, lo, hi), ...].
+    Таблицы меньше split_rows строк и таблицы без целочисленного ключа считаются одним запросом."""
+    if estimate is None or estimate < split_rows or shards <= 1:
+        return [(None, None, None)]
+    key_columns = get_key_columns(inspect(engine), table)
+    if not key_columns:
+        return [(None, None, None)]
+    try:
+        ranges = plan_key_ranges(engine, table, key_columns[0], shards)
+    except ValueError:
+        return [(None, None, None)]
+    return [(key_columns[0], lo, hi) for lo, hi in ranges]
+
+def count_rows(engine, table, key_column=None, lo=None, hi=None):
+    """Точное количество строк таблицы или её диапазона ключа [lo, hi); после разрыва
+    подключения подсчёт повторяется с новым."""
+    query = select(func.count()).select_from(sql_table(table))
+    if key_column is not None:
+        query = query.where(range_condition(column(key_column), lo, hi))
+
+    def count():
+        with engine.connect() as conn:
+            return conn.execute(query).scalar()
+
+    return with_reconnect(count)
+
+def exact_counts(engines, tables, ranges, workers):
+    """Считает строки таблиц точно, параллельно в обеих базах: у каждой базы свой пул
+    из workers потоков, крупные таблицы считаются по диапазонам ключа.
+    engines — {метка базы: engine}, ranges — {таблица: диапазоны}.
+    Возвращает {метка базы: {таблица: количество строк или текст ошибки}}."""
+    pools = {label: ThreadPoolExecutor(max_workers=max(workers, 1)) for label in engines}
+    futures = {}
+    try:
         for table in tables:
+            for label, engine in engines.items():
+                if table[label]:
+                    futures[label, table["name"]] = [
+                        pools[label].submit(count_rows, engine, table["name"], key_column, lo, hi)
+                        for key_column, lo, hi in ranges[table["name"]]
+                    ]
+        results = {label: {} for label in engines}
+        for (label, name), parts in futures.items():
             try:
-                count = conn.execute(text(f'SELECT COUNT(*) FROM "{table}"')).scalar()
-                counts[table] = count
+                results[label][name] = sum(future.result() for future in parts)
             except Exception as e:
-                counts[table] = f"Error: {e}"
-    return counts
+                results[label][name] = f"Error: {str(e).splitlines()[0]}"
+        return results
+    finally:
+        for pool in pools.values():
+            pool.shutdown(wait=True)
+
+def format_estimate(estimates, name):
+    if name not in estimates:
+        return "N/A"
+    return "—" if estimates[name] is None else estimates[name]
+
+def row_status(table, mysql_count, pg_count, counted, diverged):
+    """Итог сравнения таблицы для отчёта."""
+    if not table["mysql"]:
+        return "нет в MySQL"
+    if not table["postgres"]:
+        return "нет в PostgreSQL"
+    if not counted:
+        return "оценки расходятся" if diverged else "оценки близки"
+    if isinstance(mysql_count, str) or isinstance(pg_count, str):
+        return "ошибка"
+    return "совпадает" if mysql_count == pg_count else f"различается на {mysql_count - pg_count}"
 
 def main():
     parser = argparse.ArgumentParser(
-        description="Сравнивает количество строк в таблицах базы данных MySQL и PostgreSQL."
+        description="Сравнивает количество строк в таблицах баз данных MySQL и PostgreSQL: сначала по оценкам "
+                    "из статистики СУБД, затем точно — для таблиц, оценки которых расходятся."
     )
     parser.add_argument(
         "--mysql",
@@ -52,29 +136,109 @@ def main():
         default="postgresql+psycopg2://postgres@localhost/hexly_proj",
         help="Строка подключения к PostgreSQL (по умолчанию: postgresql+psycopg2://postgres@localhost/hexly_proj)"
     )
+    parser.add_argument(
+        "--table",
+        action="append",
+        default=None,
+        help="Таблица для сравнения; можно указать несколько раз (по умолчанию: все таблицы)"
+    )
+    parser.add_argument(
+        "--exact",
+        choices=["diverged", "all", "none"],
+        default="diverged",
+        help="Для каких таблиц выполнять точный COUNT(*): diverged — только с расходящимися оценками, "
+             "all — для всех, none — только оценки (по умолчанию: diverged)"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="Допустимое относительное расхождение оценок, при котором точный подсчёт не нужен (по умолчанию: 0.1)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Количество одновременных запросов COUNT(*) к каждой базе (по умолчанию: 4)"
+    )
+    parser.add_argument(
+        "--split-rows",
+        type=int,
+        default=5000000,
+        help="Считать по диапазонам ключа таблицы, где строк (по оценке) не меньше указанного (по умолчанию: 5000000)"
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=8,
+        help="На сколько диапазонов ключа делить крупные таблицы при точном подсчёте (по умолчанию: 8)"
+    )
     args = parser.parse_args()
 
-    print("Получаем данные из MySQL...")
-    mysql_counts = get_mysql_table_counts(args.mysql)
-    print("Получаем данные из PostgreSQL...")
-    pg_counts = get_postgres_table_counts(args.postgres)
+    mysql_engine = make_engine(args.mysql, args.workers)
+    pg_engine = make_engine(args.postgres, args.workers)
+
+    print("Получаем оценки количества строк из MySQL и PostgreSQL...")
+    mysql_estimates = get_mysql_estimates(mysql_engine)
+    pg_estimates = get_postgres_estimates(pg_engine)
 
     # Объединяем наборы таблиц (если таблица есть в одной БД, а в другой — нет, выводим N/A)
-    all_tables = set(mysql_counts.keys()) | set(pg_counts.keys())
+    names = sorted(args.table or set(mysql_estimates) | set(pg_estimates))
+    tables = [{"name": name, "mysql": name in mysql_estimates, "postgres": name in pg_estimates} for name in names]
+    diverged = {name for name in names
+                if estimates_diverge(mysql_estimates.get(name), pg_estimates.get(name), args.tolerance)}
+    if args.exact == "all":
+        to_count = tables
+    elif args.exact == "diverged":
+        to_count = [table for table in tables if table["name"] in diverged]
+    else:
+        to_count = []
+
+    counts = {"mysql": {}, "postgres": {}}
+    if to_count:
+        print(f"Точный подсчёт строк для {len(to_count)} таблиц(ы) из {len(tables)}...")
+        started = time.monotonic()
+        # Диапазоны строятся по источнику и используются в обеих базах
+        ranges = {}
+        for table in to_count:
+            estimate = max(mysql_estimates.get(table["name"]) or 0, pg_estimates.get(table["name"]) or 0)
+            try:
+                engine = mysql_engine if table["mysql"] else pg_engine
+                ranges[table["name"]] = plan_count_ranges(engine, table["name"], estimate, args.split_rows,
+                                                          args.shards)
+            except Exception as e:
+                print(f"Не удалось разбить таблицу {table['name']} на диапазоны, считаем целиком: {e}")
+                ranges[table["name"]] = [(None, None, None)]
+            parts = ranges[table["name"]]
+            if len(parts) > 1:
+                bounds = ", ".join(describe_range(lo, hi) for _, lo, hi in parts)
+                print(f"Таблица {table['name']} считается по {len(parts)} диапазонам столбца {parts[0][0]}: {bounds}")
+        counts = exact_counts({"mysql": mysql_engine, "postgres": pg_engine}, to_count, ranges, args.workers)
+        print(f"Точный подсчёт занял {time.monotonic() - started:.1f} с.")
+    counted = {table["name"] for table in to_count}
+
     output_data = []
-    for table in sorted(all_tables):
-        mysql_val = mysql_counts.get(table, "N/A")
-        pg_val = pg_counts.get(table, "N/A")
-        output_data.append([table, mysql_val, pg_val])
+    for table in tables:
+        name = table["name"]
+        mysql_count = counts["mysql"].get(name, "—")
+        pg_count = counts["postgres"].get(name, "—")
+        output_data.append([
+            name,
+            format_estimate(mysql_estimates, name),
+            format_estimate(pg_estimates, name),
+            mysql_count if table["mysql"] else "N/A",
+            pg_count if table["postgres"] else "N/A",
+            row_status(table, mysql_count, pg_count, name in counted, name in diverged),
+        ])
 
-    headers = ["Таблица", "MySQL rows", "PostgreSQL rows"]
+    headers = ["Таблица", "MySQL (оценка)", "PostgreSQL (оценка)", "MySQL rows", "PostgreSQL rows", "Статус"]
     if tabulate:
         print(tabulate(output_data, headers=headers, tablefmt="psql"))
     else:
         # Если tabulate не установлен, выводим простой текстовый вывод
-        print("{:<20} {:<15} {:<15}".format(*headers))
+        print("{:<20} {:<15} {:<20} {:<15} {:<15} {}".format(*headers))
         for row in output_data:
-            print("{:<20} {:<15} {:<15}".format(*row))
+            print("{:<20} {:<15} {:<20} {:<15} {:<15} {}".format(*[str(value) for value in row]))
 
 if __name__ == "__main__":
     main()
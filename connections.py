@@ -0,0 +1,69 @@
+# Общие подключения к MySQL и PostgreSQL для всех скриптов.
+# Движки создаются с пулом под число параллельных потоков, проверкой соединения перед выдачей
+# из пула (pre-ping) и быстрыми режимами драйверов. В процессах пула движок создаётся один раз
+# на процесс и переиспользуется всеми его задачами, поэтому подключения живут всё время работы
+# процесса, а скомпилированные запросы (кэш SQLAlchemy) не компилируются заново для каждой задачи.
+
+import os
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
+
+# Размер кэша скомпилированных запросов: запросы порций, ключей и контрольных точек строятся
+# заново на каждую порцию, но по структуре повторяются и компилируются один раз
+QUERY_CACHE_SIZE = 2000
+# MySQL закрывает простаивающие подключения по wait_timeout (по умолчанию 8 часов)
+POOL_RECYCLE = 3600
+
+_worker_engines = {}
+
+def engine_options(url, workers=1):
+    """Параметры create_engine для строки подключения: пул на workers параллельных потоков
+    (плюс одно подключение для потока чтения конвейера) и параметры драйвера."""
+    url = make_url(url)
+    options = {
+        "pool_pre_ping": True,
+        "query_cache_size": QUERY_CACHE_SIZE,
+    }
+    if url.get_backend_name() != "sqlite":
+        options.update(pool_size=max(workers, 1) + 1, max_overflow=max(workers, 1), pool_recycle=POOL_RECYCLE)
+    if url.get_driver_name() == "psycopg2":
+        # executemany для INSERT — многострочные VALUES, для UPDATE/DELETE — execute_batch
+        options["executemany_mode"] = "values_plus_batch"
+    # Для pymysql отдельных параметров нет: потоковое чтение включается на запрос
+    # (stream_results — небуферизованный SSCursor), а обычные запросы остаются буферизованными
+    return options
+
+def make_engine(url, workers=1):
+    """Создаёт движок SQLAlchemy с общими параметрами подключения (engine_options)."""
+    return create_engine(url, **engine_options(url, workers))
+
+def worker_engine(url, workers=1, setup=None):
+    """Движок для задач в процессе пула: создаётся при первой задаче процесса и переиспользуется
+    следующими. setup(engine) вызывается один раз при создании (например, apply_session_settings).
+    Движки родительского процесса после fork не используются (ключ — pid)."""
+    key = (os.getpid(), str(url), setup)
+    engine = _worker_engines.get(key)
+    if engine is None:
+        engine = make_engine(url, workers)
+        if setup is not None:
+            setup(engine)
+        _worker_engines[key] = engine
+    return engine
+
+def with_reconnect(action, retries=2, delay=1.0, log=print):
+    """Выполняет action() и повторяет его, если подключение было разорвано (сервер перезапущен,
+    соединение закрыто по таймауту): SQLAlchemy уже сбросил такое подключение, и повтор
+    получает новое. Прочие ошибки пробрасываются сразу. Подходит для идемпотентных действий."""
+    attempt = 0
+    while True:
+        try:
+            return action()
+        except DBAPIError as e:
+            if not e.connection_invalidated or attempt >= retries:
+                raise
+            attempt += 1
+            log(f"Подключение разорвано ({str(e.orig).strip()}), повтор {attempt} из {retries}...")
+            time.sleep(delay * attempt)
@@ -0,0 +1,131 @@
+# Отложенное построение первичных ключей, индексов и внешних ключей после массовой загрузки.
+# Пока таблица загружается без индексов, PostgreSQL не обновляет их построчно; после загрузки
+# каждый индекс строится одним проходом с сортировкой в maintenance_work_mem,
+# причём разные таблицы обрабатываются параллельно.
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import Column, DefaultClause, Identity, MetaData, Table, inspect, text
+from sqlalchemy.schema import AddConstraint, CreateIndex, CreateTable
+
+try:
+    from tabulate import tabulate
+except ImportError:
+    tabulate = None
+
+def bare_table(table):
+    """Копия таблицы только со столбцами: без первичного ключа, индексов и внешних ключей.
+    Столбцы IDENTITY и значения по умолчанию сохраняются."""
+    columns = []
+    for col in table.columns:
+        extra = []
+        if col.identity is not None:
+            extra.append(Identity())
+        elif isinstance(col.server_default, DefaultClause):
+            extra.append(DefaultClause(col.server_default.arg))
+        # Столбцы первичного ключа остаются NOT NULL, как и после его построения
+        columns.append(Column(col.name, col.type, *extra, nullable=col.nullable and not col.primary_key,
+                              comment=col.comment))
+    return Table(table.name, MetaData(), *columns)
+
+def create_table(conn, table, defer_indexes=False, unlogged=False):
+    """Создаёт таблицу без внешних ключей: они добавляются после загрузки всех таблиц,
+    иначе параллельная загрузка нарушала бы ссылочную целостность. При defer_indexes таблица
+    создаётся и без первичного ключа и индексов (их строит build_deferred), при unlogged —
+    нежурналируемой (UNLOGGED)."""
+    if defer_indexes:
+        conn.execute(CreateTable(bare_table(table)))
+    else:
+        conn.execute(CreateTable(table, include_foreign_key_constraints=[]))
+        for index in table.indexes:
+            conn.execute(CreateIndex(index))
+    if unlogged:
+        # Таблица ещё пуста, поэтому перевод в UNLOGGED ничего не переписывает
+        quoted = conn.dialect.identifier_preparer.format_table(table)
+        conn.execute(text(f"ALTER TABLE {quoted} SET UNLOGGED"))
+
+def _set_maintenance_work_mem(conn, maintenance_work_mem):
+    if maintenance_work_mem:
+        conn.execute(text("SELECT set_config('maintenance_work_mem', :value, false)"),
+                     {"value": maintenance_work_mem})
+        conn.commit()
+
+def timed_ddl(conn, table_name, name, statement, log=print):
+    """Выполняет DDL-оператор в отдельной транзакции и замеряет время.
+    Возвращает (таблица, объект, время в секундах, текст ошибки или None)."""
+    started = time.monotonic()
+    error = None
+    try:
+        with conn.begin():
+            conn.execute(statement)
+    except Exception as e:
+        error = str(e).splitlines()[0]
+    elapsed = time.monotonic() - started
+    log(f"{table_name}: {name} — {'ошибка: ' + error if error else 'готово'} за {elapsed:.1f} с")
+    return table_name, name, elapsed, error
+
+def build_table_indexes(engine, table, maintenance_work_mem=None, log=print):
+    """Строит первичный ключ и затем индексы одной таблицы; уже существующие пропускаются
+    (например, при повторном запуске после сбоя). Возвращает список
+    (таблица, объект, время в секундах, текст ошибки или None)."""
+    inspector = inspect(engine)
+    existing_pk = inspector.get_pk_constraint(table.name).get("constrained_columns")
+    existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+    results = []
+    with engine.connect() as conn:
+        _set_maintenance_work_mem(conn, maintenance_work_mem)
+        if table.primary_key.columns and not existing_pk:
+            results.append(timed_ddl(conn, table.name, "PRIMARY KEY", AddConstraint(table.primary_key), log))
+        for index in table.indexes:
+            if index.name in existing_indexes:
+                continue
+            results.append(timed_ddl(conn, table.name, index.name, CreateIndex(index), log))
+    return results
+
+def add_foreign_keys(engine, tables, log=print):
+    """Добавляет внешние ключи таблиц; уже существующие пропускаются. Выполняется последовательно:
+    ALTER TABLE ... ADD FOREIGN KEY блокирует обе таблицы, и параллельные добавления
+    взаимно ссылающихся таблиц приводили бы к взаимоблокировкам."""
+    inspector = inspect(engine)
+    results = []
+    with engine.connect() as conn:
+        for table in tables:
+            existing = {(tuple(fk["constrained_columns"]), fk["referred_table"])
+                        for fk in inspector.get_foreign_keys(table.name)}
+            for fk in table.foreign_key_constraints:
+                if (tuple(fk.column_keys), fk.elements[0].target_fullname.rsplit(".", 1)[0]) in existing:
+                    continue
+                results.append(timed_ddl(conn, table.name, fk.name or "FOREIGN KEY", AddConstraint(fk), log))
+    return results
+
+def build_deferred(engine, tables, workers=4, maintenance_work_mem=None, indexes=True, log=print):
+    """Строит первичные ключи и индексы таблиц (если indexes) параллельно — по таблице на поток,
+    а после них добавляет внешние ключи. Возвращает список
+    (таблица, объект, время в секундах, текст ошибки или None)."""
+    results = []
+    if indexes:
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+            futures = [pool.submit(build_table_indexes, engine, table, maintenance_work_mem, log)
+                       for table in tables]
+            for future in futures:
+                results.extend(future.result())
+    results.extend(add_foreign_keys(engine, tables, log))
+    return results
+
+def print_build_report(results):
+    """Выводит время выполнения каждой операции после загрузки (ключи, индексы, ANALYZE и т.п.)."""
+    if not results:
+        return
+    output_data = [[table, name, f"{elapsed:.1f}", error or "готово"] for table, name, elapsed, error in results]
+    headers = ["Таблица", "Операция", "Время, с", "Статус"]
+    print()
+    if tabulate:
+        print(tabulate(output_data, headers=headers, tablefmt="psql"))
+    else:
+        print("{:<30} {:<40} {:>10} {}".format(*headers))
+        for row in output_data:
+            print("{:<30} {:<40} {:>10} {}".format(*row))
+    total = sum(elapsed for _, _, elapsed, _ in results)
+    failed = sum(1 for *_, error in results if error)
+    print(f"Выполнено операций: {len(results) - failed} из {len(results)}, суммарное время: {total:.1f} с")
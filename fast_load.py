@@ -0,0 +1,96 @@
+# Режим быстрой загрузки (--fast-load) и завершающие шаги после переноса.
+# На время первичной загрузки таблицы создаются нежурналируемыми (UNLOGGED), а сессии загрузки
+# фиксируют транзакции без ожидания записи WAL на диск. После проверенной загрузки таблицы
+# переводятся в журналируемые, последовательности IDENTITY выравниваются по MAX(ключа),
+# а статистика планировщика собирается ANALYZE параллельно по таблицам.
+
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import event, text
+
+from checkpoint import copied_rows
+from deferred_indexes import timed_ddl
+
+# Параметры сессий загрузки: асинхронная фиксация (при сбое сервера теряются лишь последние
+# транзакции, а нежурналируемые таблицы всё равно очищаются) и отсутствие ограничений по времени
+FAST_LOAD_SETTINGS = {
+    "synchronous_commit": "off",
+    "statement_timeout": "0",
+    "idle_in_transaction_session_timeout": "0",
+}
+
+def apply_session_settings(engine, settings=None):
+    """Устанавливает параметры сессии (по умолчанию FAST_LOAD_SETTINGS) на каждом новом
+    подключении engine к PostgreSQL."""
+    settings = FAST_LOAD_SETTINGS if settings is None else settings
+
+    @event.listens_for(engine, "connect")
+    def set_session(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in settings.items():
+            cursor.execute("SELECT set_config(%s, %s, false)", (name, value))
+        cursor.close()
+        dbapi_connection.commit()
+
+    return engine
+
+def _quoted(conn, table):
+    return conn.dialect.identifier_preparer.format_table(table)
+
+def is_unlogged(conn, table):
+    return conn.execute(
+        text("SELECT relpersistence FROM pg_class WHERE oid = to_regclass(:name)"),
+        {"name": _quoted(conn, table)},
+    ).scalar() == "u"
+
+def lost_after_crash(conn, table):
+    """True, если нежурналируемая таблица пуста, хотя по журналу контрольных точек в неё уже
+    перенесены строки: после сбоя сервера PostgreSQL очищает такие таблицы, и продолжать перенос
+    по журналу нельзя. Пустая таблица без перенесённых по журналу строк (перенос прерван
+    до первой порции или источник пуст) потерянной не считается."""
+    if not is_unlogged(conn, table) or not copied_rows(conn, table.name):
+        return False
+    return conn.execute(text(f"SELECT NOT EXISTS (SELECT 1 FROM {_quoted(conn, table)})")).scalar()
+
+def _run_parallel(engine, tables, name, statement_for, workers, log):
+    def run(table):
+        with engine.connect() as conn:
+            return timed_ddl(conn, table.name, name, text(statement_for(conn, table)), log)
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        return list(pool.map(run, tables))
+
+def set_logged(engine, tables, workers=4, log=print):
+    """Переводит нежурналируемые таблицы в журналируемые параллельно — по таблице на поток.
+    SET LOGGED переписывает таблицу вместе с её индексами в WAL, поэтому выполняется до построения
+    отложенных индексов и до добавления внешних ключей (журналируемая таблица не может
+    ссылаться на нежурналируемую). Возвращает список
+    (таблица, операция, время в секундах, текст ошибки или None)."""
+    with engine.connect() as conn:
+        tables = [table for table in tables if is_unlogged(conn, table)]
+    return _run_parallel(engine, tables, "SET LOGGED",
+                         lambda conn, table: f"ALTER TABLE {_quoted(conn, table)} SET LOGGED", workers, log)
+
+def reset_sequences(engine, tables, log=print):
+    """Выравнивает последовательности столбцов IDENTITY по MAX(столбца): значения переносятся
+    из MySQL явно, и без этого первая вставка в PostgreSQL получила бы уже занятый ключ."""
+    results = []
+    with engine.connect() as conn:
+        for table in tables:
+            for col in table.columns:
+                if col.identity is None:
+                    continue
+                quoted_table = _quoted(conn, table)
+                quoted_column = conn.dialect.identifier_preparer.quote(col.name)
+                # is_called = false: следующее значение — ровно MAX + 1 (или 1 для пустой таблицы)
+                statement = text(
+                    f"SELECT setval(pg_get_serial_sequence(:table, :column), "
+                    f"COALESCE(MAX({quoted_column}), 0) + 1, false) FROM {quoted_table}"
+                ).bindparams(table=quoted_table, column=col.name)
+                results.append(timed_ddl(conn, table.name, f"setval({col.name})", statement, log))
+    return results
+
+def analyze_tables(engine, tables, workers=4, log=print):
+    """Собирает статистику планировщика (ANALYZE) по таблицам параллельно — по таблице на поток."""
+    return _run_parallel(engine, tables, "ANALYZE",
+                         lambda conn, table: f"ANALYZE {_quoted(conn, table)}", workers, log)
@@ -0,0 +1,160 @@
+# Потоковое сравнение ключей таблицы в MySQL и PostgreSQL слиянием двух отсортированных потоков.
+# Ключи читаются серверными курсорами в порядке ORDER BY, поэтому память не зависит от размера таблицы,
+# а расхождения выдаются сразу по мере обнаружения.
+
+from sqlalchemy import Index, MetaData, Table, and_, column, inspect, select, table as sql_table, text
+from sqlalchemy.schema import CreateIndex, DropIndex
+
+from type_mapping import index_name
+
+MISSING = "missing"  # ключ есть в источнике (MySQL), но отсутствует в приёмнике (PostgreSQL)
+EXTRA = "extra"      # ключ есть в приёмнике, но отсутствует в источнике
+
+_END = object()
+
+def _string_columns(engine, table, key_columns):
+    """Возвращает словарь {строковый столбец ключа: кодировка} (для них нужен побайтовый порядок
+    сортировки). Кодировка столбца известна только для MySQL, для остальных СУБД — None."""
+    if engine.dialect.name == "mysql":
+        query = text("""
+            SELECT COLUMN_NAME, CHARACTER_SET_NAME
+            FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND CHARACTER_SET_NAME IS NOT NULL
+        """)
+        with engine.connect() as conn:
+            return {name: charset for name, charset in conn.execute(query, {"table": table}) if name in key_columns}
+    strings = {}
+    for col in inspect(engine).get_columns(table):
+        if col["name"] in key_columns:
+            try:
+                if col["type"].python_type is str:
+                    strings[col["name"]] = None
+            except NotImplementedError:
+                pass
+    return strings
+
+def _order_expression(dialect_name, key, strings):
+    """Выражение сортировки, совпадающее с порядком сравнения строк в Python (по кодовым точкам).
+    Сортировка по умолчанию зависит от collation (регистронезависимые сравнения в MySQL,
+    локаль в PostgreSQL) и сломала бы слияние потоков. Сортируется сам столбец с двоичным
+    collation (<кодировка>_bin в MySQL, "C" в PostgreSQL), а не выражение над ним, поэтому
+    индекс с тем же collation отдаёт строки уже в нужном порядке."""
+    if key.name not in strings:
+        return key
+    if dialect_name == "mysql":
+        return key.collate(f"{strings[key.name]}_bin")
+    if dialect_name == "postgresql":
+        return key.collate("C")
+    return key
+
+def ensure_key_index(engine, table, key_columns, log=print):
+    """Создаёт в PostgreSQL индекс по столбцам ключа в порядке и с сортировкой stream_keys
+    (строковые столбцы — COLLATE "C"), если его ещё нет. Индекс покрывает запрос ключей,
+    поэтому они читаются сканированием только индекса (index-only scan), уже в нужном порядке,
+    без обращения к строкам таблицы и без сортировки. Первичный ключ для этого не подходит,
+    если он начинается с других столбцов или строки в нём упорядочены по collation базы.
+    Индекс строится через CREATE INDEX CONCURRENTLY вне транзакции и не блокирует запись
+    в таблицу; недостроенный (INVALID) индекс прошлого запуска удаляется и строится заново.
+    Для других СУБД ничего не делает. Возвращает имя индекса или None."""
+    if engine.dialect.name != "postgresql":
+        return None
+    tbl = Table(table, MetaData(), autoload_with=engine)
+    strings = _string_columns(engine, table, key_columns)
+    name = index_name(table, "key_" + "_".join(key_columns))
+    expressions = [_order_expression(engine.dialect.name, tbl.c[col], strings) for col in key_columns]
+    index = Index(name, *expressions, postgresql_concurrently=True)
+    # CONCURRENTLY нельзя выполнять внутри транзакции
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        valid = conn.execute(
+            text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"),
+            {"name": conn.dialect.identifier_preparer.quote(name)}
+        ).scalar()
+        if valid:
+            return name
+        if valid is False:
+            log(f"Индекс {name} остался недостроенным после прошлого запуска, удаляем его...")
+            conn.execute(DropIndex(index, if_exists=True))
+        log(f"Создаём индекс {name} по ключу ({', '.join(key_columns)}) таблицы '{table}' в PostgreSQL "
+            "(CREATE INDEX CONCURRENTLY)...")
+        conn.execute(CreateIndex(index, if_not_exists=True))
+    return name
+
+def stream_keys(engine, table, key_columns, batch_size=10000):
+    """Генератор значений ключа (кортежей) таблицы в порядке возрастания через серверный курсор.
+    Строки с NULL в столбцах ключа пропускаются, повторяющиеся значения выдаются один раз."""
+    tbl = sql_table(table, *[column(name) for name in key_columns])
+    key = [tbl.c[name] for name in key_columns]
+    strings = _string_columns(engine, table, key_columns)
+    order = [_order_expression(engine.dialect.name, col, strings) for col in key]
+    query = select(*key).where(and_(*[col.isnot(None) for col in key])).order_by(*order)
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, max_row_buffer=batch_size).execute(query)
+        rows = (tuple(row) for rows in result.partitions(batch_size) for row in rows)
+        yield from ordered_unique(rows, table)
+
+def ordered_unique(keys, table):
+    """Пропускает повторяющиеся подряд ключи и проверяет, что ключи идут по возрастанию:
+    слияние потоков верно только при одинаковом порядке в БД и в Python."""
+    previous = _END
+    for current in keys:
+        if previous is not _END:
+            if current == previous:
+                continue
+            if current < previous:
+                raise ValueError(
+                    f"Ключи таблицы '{table}' пришли не по возрастанию ({previous} > {current}): "
+                    "порядок сортировки БД не совпадает с порядком сравнения в Python."
+                )
+        yield current
+        previous = current
+
+class KeyDiff:
+    """Потоковое сравнение ключей таблицы в источнике и приёмнике.
+
+    Итерация выдаёт пары (MISSING, ключ) и (EXTRA, ключ) в порядке возрастания ключа;
+    счётчики обновляются по ходу итерации и окончательны после её завершения.
+    """
+
+    def __init__(self, source_engine, target_engine, table, source_key_columns,
+                 target_key_columns=None, batch_size=10000):
+        self.source_engine = source_engine
+        self.target_engine = target_engine
+        self.table = table
+        self.source_key_columns = source_key_columns
+        self.target_key_columns = target_key_columns or source_key_columns
+        self.batch_size = batch_size
+        self.source_count = 0
+        self.target_count = 0
+        self.missing_count = 0
+        self.extra_count = 0
+
+    def __iter__(self):
+        source = stream_keys(self.source_engine, self.table, self.source_key_columns, self.batch_size)
+        target = stream_keys(self.target_engine, self.table, self.target_key_columns, self.batch_size)
+        return self.merge(source, target)
+
+    def merge(self, source, target):
+        """Сливает два потока ключей, упорядоченных по возрастанию и без повторов,
+        и выдаёт пары (MISSING, ключ) и (EXTRA, ключ), обновляя счётчики."""
+        src = next(source, _END)
+        dst = next(target, _END)
+        while src is not _END or dst is not _END:
+            if dst is _END or (src is not _END and src < dst):
+                self.source_count += 1
+                self.missing_count += 1
+                yield MISSING, src
+                src = next(source, _END)
+            elif src is _END or dst < src:
+                self.target_count += 1
+                self.extra_count += 1
+                yield EXTRA, dst
+                dst = next(target, _END)
+            else:
+                self.source_count += 1
+                self.target_count += 1
+                src = next(source, _END)
+                dst = next(target, _END)
+
+    def missing(self):
+        """Генератор только недостающих в приёмнике ключей."""
+        return (key for kind, key in self if kind == MISSING)
@@ -0,0 +1,146 @@
+# Работа с ключами таблиц: keyset-пагинация и чтение таблицы порциями, разбиение таблицы
+# на диапазоны ключа (шарды) для параллельного копирования, оценка размеров таблиц
+# для планирования и повтор выполнения отдельного шарда.
+
+import time
+
+from sqlalchemy import and_, column, func, literal_column, select, table as sql_table, text, true, tuple_
+
+def get_key_columns(inspector, table):
+    """Возвращает столбцы первичного ключа таблицы, а если его нет — столбцы уникального
+    индекса без NULL-значений. Если подходящего ключа нет, возвращает None."""
+    pk_columns = inspector.get_pk_constraint(table).get("constrained_columns")
+    if pk_columns:
+        return pk_columns
+    nullable = {col["name"]: col["nullable"] for col in inspector.get_columns(table)}
+    for index in inspector.get_indexes(table):
+        if index.get("unique") and all(nullable.get(col, True) is False for col in index["column_names"]):
+            return index["column_names"]
+    return None
+
+def keyset_query(table, key_columns, last_key, chunk_size, where=None, column_names=None):
+    """Формирует запрос следующей порции: WHERE (k1, k2, ...) > (:last) ORDER BY k1, k2, ... LIMIT n.
+    Дополнительное условие where (например, диапазон шарда) объединяется через AND.
+    column_names — выбираемые столбцы в нужном порядке (по умолчанию все: SELECT *)."""
+    tbl = sql_table(table, *[column(name) for name in dict.fromkeys([*key_columns, *(column_names or [])])])
+    key = [tbl.c[name] for name in key_columns]
+    if column_names:
+        query = select(*[tbl.c[name] for name in column_names])
+    else:
+        query = select(literal_column("*")).select_from(tbl)
+    if where is not None:
+        query = query.where(where)
+    if last_key is not None:
+        if len(key) == 1:
+            query = query.where(key[0] > last_key[0])
+        else:
+            query = query.where(tuple_(*key) > tuple_(*last_key))
+    return query.order_by(*key).limit(chunk_size)
+
+def iter_chunks(engine, table, column_names, key_columns, chunk_size, where=None, last_key=None, batcher=None):
+    """Читает столбцы column_names таблицы (или её части, заданной условием where) порциями строк.
+    При наличии ключа использует keyset-пагинацию (начиная после last_key, если он задан),
+    иначе — один потоковый серверный курсор. Значения приходят от драйвера без преобразований:
+    их кодирование определяется типами столбцов в PostgreSQL.
+    С batcher (AdaptiveBatcher) порции нарезаются по объёму данных, а число строк в запросе
+    подбирается по среднему размеру строки; иначе в порции chunk_size строк."""
+    if key_columns:
+        key_indexes = [column_names.index(name) for name in key_columns]
+        with engine.connect() as conn:
+            while True:
+                limit = batcher.limit() if batcher else chunk_size
+                query = keyset_query(table, key_columns, last_key, limit, where, column_names)
+                chunk = conn.execute(query).fetchall()
+                if not chunk:
+                    break
+                last_key = tuple(chunk[-1][i] for i in key_indexes)
+                if batcher:
+                    yield from batcher.batches(chunk)
+                else:
+                    yield chunk
+                if len(chunk) < limit:
+                    break
+    else:
+        query = select(*[column(name) for name in column_names]).select_from(sql_table(table))
+        if where is not None:
+            query = query.where(where)
+        with engine.connect() as conn:
+            buffer = batcher.min_rows if batcher else chunk_size
+            result = conn.execution_options(stream_results=True, max_row_buffer=buffer).execute(query)
+            yield from batcher.batches(result) if batcher else result.partitions(chunk_size)
+
+def range_condition(key, lo, hi):
+    """Условие попадания столбца key в полуинтервал [lo, hi); None означает открытую границу."""
+    conditions = []
+    if lo is not None:
+        conditions.append(key >= lo)
+    if hi is not None:
+        conditions.append(key < hi)
+    return and_(*conditions) if conditions else true()
+
+def describe_range(lo, hi):
+    """Человекочитаемое представление диапазона шарда."""
+    return f"[{'-∞' if lo is None else lo}, {'+∞' if hi is None else hi})"
+
+def _minmax_bounds(conn, key, shards):
+    lo, hi = conn.execute(select(func.min(key), func.max(key))).one()
+    if lo is None:
+        return []
+    if not isinstance(lo, int) or not isinstance(hi, int):
+        raise ValueError("разбиение по MIN/MAX возможно только для целочисленного ключа")
+    step = (hi - lo + 1) / shards
+    return [lo + int(step * i) for i in range(1, shards)]
+
+def _quantile_bounds(conn, key, shards):
+    # NTILE делит упорядоченные значения ключа на равные по числу строк группы;
+    # минимумы групп (кроме первой) и есть границы шардов
+    buckets = select(key.label("k"), func.ntile(shards).over(order_by=key).label("bucket")).subquery()
+    query = select(func.min(buckets.c.k)).group_by(buckets.c.bucket).order_by(func.min(buckets.c.k))
+    return [row[0] for row in conn.execute(query)][1:]
+
+def plan_key_ranges(engine, table, key_column, shards, strategy="minmax"):
+    """Делит значения key_column на не более чем shards полуинтервалов [lo, hi).
+
+    strategy="minmax" — равные по ширине интервалы между MIN и MAX (целочисленный ключ);
+    strategy="quantile" — интервалы с примерно равным числом строк (NTILE, нужен MySQL 8+).
+    Крайние интервалы открыты (None), чтобы не потерять строки за пределами выборки.
+    """
+    if shards <= 1:
+        return [(None, None)]
+    key = sql_table(table, column(key_column)).c[key_column]
+    with engine.connect() as conn:
+        if strategy == "quantile":
+            bounds = _quantile_bounds(conn, key, shards)
+        else:
+            bounds = _minmax_bounds(conn, key, shards)
+    edges = [None] + sorted(set(bounds)) + [None]
+    return list(zip(edges[:-1], edges[1:]))
+
+def get_table_sizes(engine):
+    """Возвращает словарь {таблица: (DATA_LENGTH, TABLE_ROWS)} из information_schema.TABLES
+    для текущей базы MySQL. TABLE_ROWS в InnoDB — оценка, но для планирования её достаточно."""
+    query = text("""
+        SELECT TABLE_NAME, DATA_LENGTH, TABLE_ROWS
+        FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_TYPE = 'BASE TABLE'
+    """)
+    try:
+        with engine.connect() as conn:
+            return {row[0]: (row[1] or 0, row[2] or 0) for row in conn.execute(query)}
+    except Exception as e:
+        print(f"Не удалось получить размеры таблиц из information_schema: {e}")
+        return {}
+
+def run_with_retries(action, retries, label, delay=5.0):
+    """Выполняет action(), при ошибке повторяя попытку до retries раз.
+    Возвращает результат action(); после исчерпания попыток пробрасывает последнюю ошибку."""
+    attempt = 0
+    while True:
+        try:
+            return action()
+        except Exception as e:
+            attempt += 1
+            if attempt > retries:
+                raise
+            print(f"{label}: ошибка ({e}), повтор {attempt} из {retries} через {delay:.0f} с...")
+            time.sleep(delay * attempt)
@@ -0,0 +1,200 @@
+# Метрики производительности переноса: строки и байты в секунду, время по стадиям
+# (чтение из MySQL, очистка, запись в PostgreSQL), гистограмма задержки порций и пиковая память.
+# Метрики выгружаются в JSON Lines (по записи на таблицу или шард за запуск) и в текстовый файл
+# Prometheus для textfile collector node_exporter, чтобы запуски можно было сравнивать на графиках.
+
+import datetime
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Границы корзин гистограммы задержки порции (от начала чтения до фиксации записи), в секундах
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+STAGES = ("fetch", "transform", "write")
+STAGE_NAMES = {"fetch": "чтение", "transform": "очистка", "write": "запись", "wait": "простой записи"}
+PROMETHEUS_PREFIX = "db_migration"
+
+def peak_rss_bytes():
+    """Пиковый объём резидентной памяти текущего процесса в байтах (None, если недоступен)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux сообщает ru_maxrss в килобайтах, macOS — в байтах
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def estimate_bytes(rows):
+    """Оценка объёма порции по значениям: длина строк и байтов, 8 байт на прочие значения."""
+    size = 0
+    for row in rows:
+        for value in row:
+            if value is None:
+                continue
+            size += len(value) if isinstance(value, (str, bytes, bytearray)) else 8
+    return size
+
+class TransferMetrics:
+    """Счётчики переноса одной таблицы или одного её шарда в пределах процесса."""
+
+    def __init__(self, script, table, shard=""):
+        self.script = script
+        self.table = table
+        self.shard = shard
+        self.rows = 0
+        self.bytes = 0
+        self.batches = 0
+        self.stages = dict.fromkeys(STAGES, 0.0)
+        self.latency_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.error = None
+        self.started_at = datetime.datetime.now(datetime.timezone.utc)
+        self.started = time.monotonic()
+        self.elapsed = None
+        self.fetch_started = self.started
+
+    @contextmanager
+    def stage(self, name):
+        """Добавляет время выполнения блока к стадии name."""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.monotonic() - started
+
+    def timed(self, iterable, name="fetch"):
+        """Выдаёт элементы iterable, добавляя время ожидания каждого к стадии name.
+        Момент начала чтения очередной порции запоминается для расчёта её задержки."""
+        iterator = iter(iterable)
+        while True:
+            self.fetch_started = time.monotonic()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.stages[name] = self.stages.get(name, 0.0) + time.monotonic() - self.fetch_started
+                return
+            self.stages[name] = self.stages.get(name, 0.0) + time.monotonic() - self.fetch_started
+            yield item
+
+    def add_batch(self, rows, started=None):
+        """Учитывает записанную порцию; задержка считается от started (по умолчанию —
+        от начала чтения порции в timed) до текущего момента."""
+        latency = time.monotonic() - (self.fetch_started if started is None else started)
+        self.rows += len(rows)
+        self.bytes += estimate_bytes(rows)
+        self.batches += 1
+        self.latency_sum += latency
+        bucket = 0
+        while bucket < len(LATENCY_BUCKETS) and latency > LATENCY_BUCKETS[bucket]:
+            bucket += 1
+        self.latency_counts[bucket] += 1
+
+    def finish(self, error=None):
+        self.error = error
+        self.elapsed = time.monotonic() - self.started
+        return self
+
+    def as_dict(self):
+        """Метрики в виде словаря, пригодного для JSON и передачи между процессами."""
+        elapsed = self.elapsed if self.elapsed is not None else time.monotonic() - self.started
+        return {
+            "script": self.script,
+            "table": self.table,
+            "shard": self.shard,
+            "started_at": self.started_at.isoformat(),
+            "elapsed": round(elapsed, 6),
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "batches": self.batches,
+            "rows_per_second": round(self.rows / elapsed, 3) if elapsed > 0 else 0.0,
+            "bytes_per_second": round(self.bytes / elapsed, 3) if elapsed > 0 else 0.0,
+            "stages": {name: round(value, 6) for name, value in self.stages.items()},
+            "latency_buckets": list(LATENCY_BUCKETS),
+            "latency_counts": list(self.latency_counts),
+            "latency_sum": round(self.latency_sum, 6),
+            "peak_rss_bytes": peak_rss_bytes(),
+            "error": self.error,
+        }
+
+def format_summary(record):
+    """Одна строка с итогами записи метрик: скорость, время по стадиям и пиковая память."""
+    stages = ", ".join(f"{STAGE_NAMES.get(name, name)} {value:.1f} с"
+                       for name, value in record["stages"].items())
+    line = (f"{record['rows_per_second']:.0f} строк/с, {record['bytes_per_second'] / 2**20:.2f} МБ/с; "
+            f"{stages}")
+    if record["peak_rss_bytes"]:
+        line += f"; пиковая память {record['peak_rss_bytes'] / 2**20:.0f} МБ"
+    return line
+
+def write_jsonl(records, path):
+    """Дописывает записи метрик в файл JSON Lines."""
+    with open(path, "a", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(record, **extra):
+    labels = {"script": record["script"], "table": record["table"], "shard": record["shard"], **extra}
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in labels.items()) + "}"
+
+def prometheus_text(records):
+    """Формирует метрики в текстовом формате экспозиции Prometheus."""
+    # Объёмы переноса только растут, поэтому это счётчики (имена с суффиксом _total)
+    values = [
+        ("rows_total", "counter", "Перенесено строк", "rows"),
+        ("bytes_total", "counter", "Перенесено байт (оценка по значениям)", "bytes"),
+        ("batches_total", "counter", "Записано порций", "batches"),
+        ("elapsed_seconds", "gauge", "Время переноса", "elapsed"),
+        ("rows_per_second", "gauge", "Строк в секунду", "rows_per_second"),
+        ("bytes_per_second", "gauge", "Байт в секунду", "bytes_per_second"),
+        ("peak_rss_bytes", "gauge", "Пиковая резидентная память процесса", "peak_rss_bytes"),
+    ]
+    lines = []
+    for name, kind, help_text, field in values:
+        metric = f"{PROMETHEUS_PREFIX}_{name}"
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+        lines += [f"{metric}{_labels(record)} {record[field]}" for record in records if record[field] is not None]
+    metric = f"{PROMETHEUS_PREFIX}_failed"
+    lines += [f"# HELP {metric} 1, если перенос завершился ошибкой", f"# TYPE {metric} gauge"]
+    lines += [f"{metric}{_labels(record)} {1 if record['error'] else 0}" for record in records]
+    metric = f"{PROMETHEUS_PREFIX}_stage_seconds"
+    lines += [f"# HELP {metric} Время по стадиям переноса", f"# TYPE {metric} gauge"]
+    for record in records:
+        lines += [f"{metric}{_labels(record, stage=stage)} {value}" for stage, value in record["stages"].items()]
+    metric = f"{PROMETHEUS_PREFIX}_batch_latency_seconds"
+    lines += [f"# HELP {metric} Задержка порции от начала чтения до фиксации записи", f"# TYPE {metric} histogram"]
+    for record in records:
+        cumulative = 0
+        for bound, count in zip(list(record["latency_buckets"]) + ["+Inf"], record["latency_counts"]):
+            cumulative += count
+            lines.append(f"{metric}_bucket{_labels(record, le=bound)} {cumulative}")
+        lines.append(f"{metric}_sum{_labels(record)} {record['latency_sum']}")
+        lines.append(f"{metric}_count{_labels(record)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+def write_prometheus(records, path):
+    """Записывает метрики в текстовый файл Prometheus. Файл заменяется атомарно, чтобы
+    textfile collector не прочитал его наполовину записанным."""
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        f.write(prometheus_text(records))
+    os.replace(temporary, path)
+
+def export_metrics(records, jsonl_path=None, prometheus_path=None):
+    """Выгружает записи метрик в указанные файлы (пути None пропускаются)."""
+    records = [record for record in records if record]
+    if not records:
+        return
+    if jsonl_path:
+        write_jsonl(records, jsonl_path)
+        print(f"Метрики дописаны в {jsonl_path}")
+    if prometheus_path:
+        write_prometheus(records, prometheus_path)
+        print(f"Метрики Prometheus записаны в {prometheus_path}")
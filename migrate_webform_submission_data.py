@@ -1,119 +1,197 @@
 #!/usr/bin/env python3
 # Команда для запуска с удалением существующей таблицы:
 # python migrate_webform_submission_data.py --table webform_submission_data --drop
+# Параллельный перенос восемью диапазонами sid:
+# python migrate_webform_submission_data.py --drop --shards 8 --shard-strategy quantile
+# Продолжение прерванного переноса с последней контрольной точки:
+# python migrate_webform_submission_data.py --resume
+# Загрузка без индексов с построением первичного ключа и индексов после неё:
+# python migrate_webform_submission_data.py --drop --defer-indexes --maintenance-work-mem 2GB
+# Первичная загрузка в нежурналируемую таблицу без ожидания записи WAL:
+# python migrate_webform_submission_data.py --drop --defer-indexes --fast-load
 
 #!/usr/bin/env python3
 import argparse
-import sys
-from sqlalchemy import create_engine, MetaData, Table, select, text, Text
-from sqlalchemy.dialects.mysql import MEDIUMTEXT
-
-def get_primary_key_mysql(engine, table):
-    """Определяет имя первичного ключа в MySQL для указанной таблицы."""
-    with engine.connect() as conn:
-        result = conn.execute(
-            text(f"SHOW KEYS FROM {table} WHERE Key_name = 'PRIMARY'")
-        ).mappings().all()
-        if result:
-            return result[0]["Column_name"]
-        else:
-            return None
-
-def get_primary_key_pg(engine, table):
-    """Определяет имя первичного ключа в PostgreSQL для указанной таблицы,
-    используя information_schema. Если не найден стандартным способом, проверяет наличие столбца 'sid'."""
-    with engine.connect() as conn:
-        query = text("""
-            SELECT kcu.column_name
-            FROM information_schema.table_constraints tc
-            JOIN information_schema.key_column_usage kcu
-              ON tc.constraint_name = kcu.constraint_name
-            WHERE tc.table_name = :table AND tc.constraint_type = 'PRIMARY KEY'
-            LIMIT 1
-        """)
-        result = conn.execute(query, {"table": table}).mappings().all()
-        if result:
-            return result[0]["column_name"]
-        else:
-            col_query = text("SELECT column_name FROM information_schema.columns WHERE table_name = :table")
-            cols = {row["column_name"] for row in conn.execute(col_query, {"table": table}).mappings().all()}
-            if "sid" in cols:
-                return "sid"
-            else:
-                return None
+import time
+from contextlib import closing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from sqlalchemy import (inspect, MetaData, Table, select, tuple_,
+                        table as sql_table, column)
+from sqlalchemy.dialects import postgresql
+from pg_copy import copy_supported, write_chunk
+from connections import make_engine, worker_engine
+from sanitize import build_row_sanitizer
+from type_mapping import reflect_source_tables, map_table
+from deferred_indexes import create_table, build_deferred, print_build_report
+from metrics import TransferMetrics, format_summary, export_metrics
+from pipeline import pipeline
+from batch_sizing import AdaptiveBatcher
+from fast_load import apply_session_settings, lost_after_crash, set_logged, reset_sequences, analyze_tables
+from key_ranges import plan_key_ranges, range_condition, describe_range, run_with_retries
+from checkpoint import (ensure_checkpoint_table, load_checkpoint, save_checkpoint, register_shards,
+                        load_shards, has_checkpoints, clear_checkpoints)
+
+def reflect_source_table(engine, table_name, log=print):
+    """Отражает схему таблицы из MySQL и строит по ней таблицу PostgreSQL с отображёнными типами."""
+    source = reflect_source_tables(engine, [table_name]).tables[table_name]
+    table = map_table(source, MetaData(), log=log)
+    pg_dialect = postgresql.dialect()
+    for source_col, col in zip(source.columns, table.columns):
+        source_type, target_type = str(source_col.type), col.type.compile(dialect=pg_dialect)
+        if source_type != target_type:
+            log(f"Тип столбца '{col.name}': {source_type} → {target_type}.")
+    return table
+
+def transfer_rows(mysql_engine, pg_engine, table, chunk_size, loader, where=None, shard="", log=print,
+                  metrics=None, depth=2, batch_bytes=0, batch_latency=0.0):
+    """Переносит строки таблицы (или только удовлетворяющие условию where) порциями в порядке
+    первичного ключа. Каждая порция фиксируется в PostgreSQL отдельной транзакцией вместе
+    с контрольной точкой, поэтому повторный вызов продолжает с последнего зафиксированного ключа.
+    Следующие порции читаются и очищаются в фоновых потоках, пока записывается текущая
+    (не больше depth порций в каждой очереди; 0 — стадии по очереди).
+    Время чтения, очистки и записи порций учитывается в metrics (TransferMetrics), если они заданы.
+    При batch_bytes порции набираются по объёму значений (не больше chunk_size строк), строки
+    с большими значениями переносятся отдельными порциями, а бюджет уменьшается, если запись
+    порции дольше batch_latency секунд (AdaptiveBatcher).
+    Таблица без первичного ключа не может продолжить перенос с контрольной точки: строки
+    прерванной попытки (в пределах where) удаляются, и перенос начинается сначала.
+    Возвращает общее количество перенесённых строк (включая перенесённые ранее)."""
+    if metrics is None:
+        metrics = TransferMetrics("migrate_webform_submission_data", table.name, shard)
+    with pg_engine.begin() as pg_conn:
+        state = load_checkpoint(pg_conn, table.name, shard)
+        if state and state["completed"]:
+            log(f"Перенос уже завершён ранее: {state['rows']} строк.")
+            return state["rows"]
+        if state and not table.primary_key.columns:
+            # Без первичного ключа продолжить с места остановки нельзя: строки, зафиксированные
+            # прерванной попыткой, удаляются, и диапазон переносится заново
+            target = sql_table(table.name)
+            pg_conn.execute(target.delete().where(where) if where is not None else target.delete())
+            save_checkpoint(pg_conn, table.name, None, 0, 0.0, shard)
+            log(f"Таблица без первичного ключа: удалено {state['rows']} строк прерванного переноса.")
+            state = None
+    last_key = state["last_key"] if state else None
+    total = state["rows"] if state else 0
+    started = time.monotonic() - (state["elapsed"] if state else 0.0)
+    if last_key is not None:
+        log(f"Продолжаем с ключа {last_key} (уже перенесено строк: {total}).")
+
+    # Значения читаются без обработки типов MySQL: их кодирование определяется типами PostgreSQL
+    source = sql_table(table.name, *[column(col.name) for col in table.columns])
+    key = [source.c[col.name] for col in table.primary_key.columns]
+    key_indexes = [list(table.columns).index(col) for col in table.primary_key.columns]
+    # План очистки значений строится один раз и затрагивает только столбцы, которым она нужна
+    sanitize = build_row_sanitizer(list(table.columns))
+    query = select(*source.c)
+    if where is not None:
+        query = query.where(where)
+    if key:
+        if last_key is not None:
+            query = query.where(key[0] > last_key[0] if len(key) == 1 else tuple_(*key) > tuple_(*last_key))
+        query = query.order_by(*key)
+
+    batcher = AdaptiveBatcher(batch_bytes, chunk_size, target_latency=batch_latency) if batch_bytes else None
+
+    def read_partitions():
+        # Подключение к MySQL открывается и закрывается в потоке чтения конвейера
+        with mysql_engine.connect() as mysql_conn:
+            # Небуферизованный серверный курсор (pymysql SSCursor): строки читаются по мере обработки;
+            # с бюджетом в байтах буфер драйвера невелик, чтобы порцию ограничивал именно бюджет
+            result = mysql_conn.execution_options(
+                stream_results=True, max_row_buffer=batcher.min_rows if batcher else chunk_size
+            ).execute(query)
+            yield from batcher.batches(result) if batcher else result.partitions(chunk_size)
+
+    stages = pipeline(read_partitions(), lambda partition: [sanitize(row) for row in partition], depth, metrics)
+    with pg_engine.connect() as pg_conn, closing(stages):
+        for partition, sanitized_chunk, fetch_started in stages:
+            if key:
+                last_key = tuple(partition[-1][i] for i in key_indexes)
+            write_started = time.monotonic()
+            with metrics.stage("write"), pg_conn.begin():
+                write_chunk(pg_conn, table, sanitized_chunk, loader)
+                total += len(sanitized_chunk)
+                save_checkpoint(pg_conn, table.name, last_key, total, time.monotonic() - started, shard)
+            if batcher:
+                batcher.record_write(sanitized_chunk, time.monotonic() - write_started)
+            metrics.add_batch(sanitized_chunk, fetch_started)
+            log(f"Перенесено строк: {total}")
+        with pg_conn.begin():
+            save_checkpoint(pg_conn, table.name, last_key, total, time.monotonic() - started, shard,
+                            completed=True)
+    return total
 
-def get_all_keys(engine, table, key_column, db_label):
-    """Возвращает множество значений ключевого столбца из таблицы.
-    Если возникает ошибка (например, столбец не найден), пытается определить первичный ключ автоматически."""
+def copy_shard(mysql_url, pg_url, table_name, shard_column, lo, hi, chunk_size, loader, retries,
+               fast_load=False, depth=2, batch_bytes=0, batch_latency=0.0):
+    """Переносит диапазон [lo, hi) столбца shard_column в процессе пула с собственными подключениями.
+    Порции фиксируются вместе с контрольной точкой шарда, поэтому повтор после ошибки
+    продолжает с последнего зафиксированного ключа и не создаёт дубликатов
+    (для таблицы без первичного ключа диапазон очищается и переносится заново).
+    При fast_load подключения к PostgreSQL фиксируют транзакции без ожидания записи WAL.
+    Возвращает кортеж (lo, hi, перенесено строк, время в секундах, текст ошибки или None, словарь метрик)."""
+    quiet = lambda *args: None
+    started = time.monotonic()
+    # Движки процесса переиспользуются следующими диапазонами, переносимыми этим же процессом
+    mysql_engine = worker_engine(mysql_url)
+    pg_engine = worker_engine(pg_url, setup=apply_session_settings if fast_load else None)
+    rows, error = 0, None
+    label = describe_range(lo, hi)
+    metrics = TransferMetrics("migrate_webform_submission_data", table_name, label)
     try:
-        with engine.connect() as conn:
-            query = text(f"SELECT {key_column} FROM {table}")
-            result = conn.execute(query)
-            keys = {row[0] for row in result.mappings().all()}
-        return keys
+        table = reflect_source_table(mysql_engine, table_name, log=quiet)
+        where = range_condition(column(shard_column), lo, hi)
+        rows = run_with_retries(
+            lambda: transfer_rows(mysql_engine, pg_engine, table, chunk_size, loader, where, label, log=quiet,
+                                  metrics=metrics, depth=depth, batch_bytes=batch_bytes,
+                                  batch_latency=batch_latency),
+            retries, f"Диапазон {label}"
+        )
     except Exception as e:
-        err_str = str(e)
-        if ("Unknown column" in err_str) or ("does not exist" in err_str):
-            print(f"Не найден столбец '{key_column}' в таблице '{table}' в {db_label}.")
-            print("Пытаемся определить первичный ключ автоматически...")
-            if db_label == "MySQL":
-                pk = get_primary_key_mysql(engine, table)
-            else:
-                pk = get_primary_key_pg(engine, table)
-            if pk is None:
-                print(f"Не удалось обнаружить первичный ключ для таблицы '{table}' в {db_label}.")
-                sys.exit(1)
-            print(f"Обнаружен первичный ключ: '{pk}'. Повторяем запрос с этим столбцом...")
-            with engine.connect() as conn:
-                query = text(f"SELECT {pk} FROM {table}")
-                result = conn.execute(query)
-                keys = {row[0] for row in result.mappings().all()}
-            return keys
-        else:
-            print(f"Ошибка при получении ключей из таблицы '{table}' в {db_label} с использованием столбца '{key_column}':\n{e}")
-            sys.exit(1)
-
-def fetch_rows_by_key(engine, table, key_column, key_value):
-    """Получает из таблицы все строки, удовлетворяющие условию key_column = key_value.
-    Возвращает список строк (каждая строка — словарь)."""
-    with engine.connect() as conn:
-        query = text(f"SELECT * FROM {table} WHERE {key_column} = :key_val")
-        results = conn.execute(query, {"key_val": key_value}).mappings().all()
-        return [dict(row) for row in results]
-
-def sanitize_value(value):
-    """Очищает значение от NUL-символов.
-    Если значение является строкой, удаляет символы '\0'. Если это байты, пытается декодировать в UTF-8."""
-    if value is None:
-        return value
-    elif isinstance(value, str):
-        return value.replace('\0', '')
-    elif isinstance(value, bytes):
-        try:
-            decoded = value.decode('utf-8', errors='ignore')
-            return decoded.replace('\0', '')
-        except Exception:
-            return value
-    else:
-        return value
+        error = str(e)
+    return lo, hi, rows, time.monotonic() - started, error, metrics.finish(error).as_dict()
 
-def sanitize_row(row):
-    """Применяет sanitize_value ко всем полям строки (словаря)."""
-    return {key: sanitize_value(value) for key, value in row.items()}
-
-def insert_row_pg(engine, table, row_dict):
-    """Вставляет строку (словарь с данными) в таблицу PostgreSQL.
-    Перед вставкой очищает строковые поля от NUL-символов.
-    Формирует запрос INSERT, используя имена столбцов из row_dict."""
-    if not row_dict:
-        return
-    sanitized_row = sanitize_row(row_dict)
-    columns = sanitized_row.keys()
-    columns_str = ", ".join(columns)
-    placeholders = ", ".join(f":{col}" for col in columns)
-    insert_stmt = text(f"INSERT INTO {table} ({columns_str}) VALUES ({placeholders})")
-    with engine.begin() as conn:
-        conn.execute(insert_stmt, sanitized_row)
+def copy_sharded(args, mysql_engine, pg_engine, pg_table, loader, records):
+    """Делит таблицу на диапазоны столбца --shard-key и переносит их параллельно.
+    Метрики переноса диапазонов добавляются в список records.
+    Возвращает количество перенесённых строк или None, если часть диапазонов перенести не удалось."""
+    if args.shard_key not in pg_table.c:
+        print(f"Столбец '{args.shard_key}' для разбиения не найден в таблице '{args.table}'.")
+        return None
+    with pg_engine.begin() as conn:
+        saved = load_shards(conn, args.table) if args.resume else {}
+    if saved:
+        ranges = list(saved.values())
+        print(f"Используем разбиение на диапазоны из журнала ({len(ranges)} шт.).")
+    else:
+        ranges = plan_key_ranges(mysql_engine, args.table, args.shard_key, args.shards, args.shard_strategy)
+        with pg_engine.begin() as conn:
+            register_shards(conn, args.table, {describe_range(lo, hi): (lo, hi) for lo, hi in ranges})
+    workers = args.workers or len(ranges)
+    print(f"Таблица разбита на {len(ranges)} диапазон(ов) по столбцу '{args.shard_key}', процессов: {workers}.")
+    total = 0
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(copy_shard, args.mysql, args.postgres, args.table, args.shard_key,
+                        lo, hi, args.chunk_size, loader, args.retries, args.fast_load, args.pipeline_depth,
+                        args.batch_mb << 20, args.batch_latency)
+            for lo, hi in ranges
+        ]
+        for future in as_completed(futures):
+            lo, hi, rows, elapsed, error, record = future.result()
+            records.append(record)
+            if error:
+                print(f"Диапазон {describe_range(lo, hi)}: ошибка: {error}")
+                failed.append((lo, hi))
+            else:
+                total += rows
+                print(f"Диапазон {describe_range(lo, hi)}: перенесено строк {rows} за {elapsed:.1f} с "
+                      f"(всего: {total}); {format_summary(record)}")
+    if failed:
+        print(f"Не удалось перенести {len(failed)} диапазон(ов) из {len(ranges)}.")
+        return None
+    return total
 
 def main():
     parser = argparse.ArgumentParser(
@@ -130,69 +208,164 @@ def main():
                         help="Название таблицы для миграции (по умолчанию: webform_submission_data)")
     parser.add_argument("--drop", action="store_true",
                         help="Если указано, удаляет таблицу в PostgreSQL (если существует) перед созданием новой.")
+    parser.add_argument("--loader", choices=["copy", "insert"], default=None,
+                        help="Способ загрузки в PostgreSQL: copy (COPY FROM STDIN) или insert (executemany). "
+                             "По умолчанию copy для драйвера psycopg2, иначе insert.")
+    parser.add_argument("--chunk-size", type=int, default=10000,
+                        help="Количество строк в одной порции чтения и записи; с --batch-mb — наибольшее (по умолчанию: 10000)")
+    parser.add_argument("--batch-mb", type=int, default=64,
+                        help="Бюджет порции в мегабайтах: порции набираются по объёму значений, строки "
+                             "от четверти бюджета переносятся отдельно; 0 — порции по --chunk-size строк (по умолчанию: 64)")
+    parser.add_argument("--batch-latency", type=float, default=5.0,
+                        help="Если запись порции дольше стольких секунд, бюджет порций уменьшается; "
+                             "0 — не учитывать время записи (по умолчанию: 5.0)")
+    parser.add_argument("--pipeline-depth", type=int, default=2,
+                        help="Сколько порций может ждать очистки и записи, пока читаются следующие; "
+                             "0 — читать, очищать и записывать по очереди (по умолчанию: 2)")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="На сколько диапазонов ключа делить таблицу для параллельного копирования (по умолчанию: 1 — не делить)")
+    parser.add_argument("--shard-key", type=str, default="sid",
+                        help="Столбец, по диапазонам которого делится таблица (по умолчанию: sid)")
+    parser.add_argument("--shard-strategy", choices=["minmax", "quantile"], default="minmax",
+                        help="Границы диапазонов: minmax — равные интервалы между MIN и MAX, quantile — равные по числу строк (по умолчанию: minmax)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Количество параллельных процессов для диапазонов (по умолчанию: по числу диапазонов)")
+    parser.add_argument("--retries", type=int, default=2,
+                        help="Количество повторов переноса диапазона при ошибке (по умолчанию: 2)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Продолжить прерванный перенос с последней контрольной точки вместо переноса с нуля.")
+    parser.add_argument("--defer-indexes", action="store_true",
+                        help="Создать таблицу без первичного ключа и индексов и построить их после загрузки данных.")
+    parser.add_argument("--maintenance-work-mem", type=str, default="1GB",
+                        help="maintenance_work_mem для построения индексов при --defer-indexes (по умолчанию: 1GB)")
+    parser.add_argument("--fast-load", action="store_true",
+                        help="Загружать в нежурналируемую (UNLOGGED) таблицу с synchronous_commit=off "
+                             "и переводить её в журналируемую после загрузки.")
+    parser.add_argument("--metrics-jsonl", type=str, default=None,
+                        help="Дописывать метрики переноса (по таблице или диапазону) в файл JSON Lines (по умолчанию: не записывать)")
+    parser.add_argument("--metrics-prom", type=str, default=None,
+                        help="Записывать метрики в текстовый файл Prometheus для textfile collector (по умолчанию: не записывать)")
     args = parser.parse_args()
 
     # Создаем движки подключения
-    mysql_engine = create_engine(args.mysql)
-    pg_engine = create_engine(args.postgres)
-
-    # Создаем объект MetaData для отражения схемы из MySQL
-    metadata = MetaData()
+    mysql_engine = make_engine(args.mysql)
+    pg_engine = make_engine(args.postgres)
+    if args.fast_load:
+        apply_session_settings(pg_engine)
 
     print(f"Отражаем схему таблицы '{args.table}' из MySQL...")
     try:
-        mysql_table = Table(args.table, metadata, autoload_with=mysql_engine)
+        pg_table = reflect_source_table(mysql_engine, args.table)
     except Exception as e:
         print(f"Ошибка при отражении таблицы '{args.table}' из MySQL: {e}")
         return
 
-    # Преобразуем неподдерживаемые типы, например, MEDIUMTEXT → Text
-    for col in mysql_table.columns:
-        if isinstance(col.type, MEDIUMTEXT):
-            print(f"Преобразуем тип столбца '{col.name}' с MEDIUMTEXT на Text().")
-            col.type = Text()
+    ensure_checkpoint_table(pg_engine)
+    resume = args.resume
+    exists = inspect(pg_engine).has_table(args.table)
+    if resume and not pg_table.primary_key.columns:
+        print(f"У таблицы '{args.table}' нет первичного ключа: продолжение невозможно, переносим с нуля.")
+        resume = False
+        args.drop = True
+    if resume and not exists:
+        print(f"Таблица '{args.table}' не найдена в PostgreSQL: переносим с нуля.")
+        resume = False
+    if resume:
+        with pg_engine.connect() as conn:
+            journaled = has_checkpoints(conn, args.table)
+        if not journaled:
+            # Таблица заполнена переносом без журнала: повтор всех порций дал бы дубликаты
+            print(f"Для таблицы '{args.table}' в журнале нет контрольных точек: переносим с нуля.")
+            resume = False
+            args.drop = True
+    if resume:
+        with pg_engine.connect() as conn:
+            lost = lost_after_crash(conn, pg_table)
+        if lost:
+            print(f"Таблица '{args.table}' нежурналируемая и пуста после сбоя сервера: переносим с нуля.")
+            resume = False
+            args.drop = True
+    args.resume = resume
 
-    # Если указан флаг --drop, удаляем таблицу в PostgreSQL, если она существует
-    if args.drop:
-        print(f"Удаляем таблицу '{args.table}' в PostgreSQL, если она существует...")
+    if resume:
+        print(f"Продолжаем перенос таблицы '{args.table}' по журналу контрольных точек...")
+    else:
+        # Если указан флаг --drop, удаляем таблицу в PostgreSQL, если она существует
+        if args.drop:
+            print(f"Удаляем таблицу '{args.table}' в PostgreSQL, если она существует...")
+            try:
+                pg_metadata = MetaData()
+                table_to_drop = Table(args.table, pg_metadata, autoload_with=pg_engine)
+                table_to_drop.drop(pg_engine, checkfirst=True)
+            except Exception as e:
+                print(f"Ошибка при удалении таблицы в PostgreSQL: {e}")
+
+        elif exists:
+            print(f"Таблица '{args.table}' уже существует в PostgreSQL: укажите --drop, чтобы перенести её "
+                  f"заново, или --resume, чтобы продолжить прерванный перенос.")
+            return
+
+        print(f"Создаем таблицу '{args.table}' в PostgreSQL...")
         try:
-            pg_metadata = MetaData()
-            table_to_drop = Table(args.table, pg_metadata, autoload_with=pg_engine)
-            table_to_drop.drop(pg_engine, checkfirst=True)
+            with pg_engine.begin() as conn:
+                create_table(conn, pg_table, args.defer_indexes, unlogged=args.fast_load)
         except Exception as e:
-            print(f"Ошибка при удалении таблицы в PostgreSQL: {e}")
+            print(f"Ошибка при создании таблицы '{args.table}' в PostgreSQL: {e}")
+            return
+        with pg_engine.begin() as conn:
+            clear_checkpoints(conn, args.table)
 
-    print(f"Создаем таблицу '{args.table}' в PostgreSQL...")
+    loader = args.loader
+    if loader is None:
+        loader = "copy" if copy_supported(pg_engine) else "insert"
+    elif loader == "copy" and not copy_supported(pg_engine):
+        print(f"COPY не поддерживается драйвером '{pg_engine.dialect.driver}', используем INSERT.")
+        loader = "insert"
+
+    if args.batch_mb:
+        print(f"Переносим данные порциями до {args.batch_mb} МБ и {args.chunk_size} строк (способ загрузки: {loader})...")
+    else:
+        print(f"Переносим данные порциями по {args.chunk_size} строк (способ загрузки: {loader})...")
+    records = []
+    error = None
     try:
-        mysql_table.create(pg_engine)
+        if args.shards > 1:
+            total = copy_sharded(args, mysql_engine, pg_engine, pg_table, loader, records)
+        else:
+            metrics = TransferMetrics("migrate_webform_submission_data", args.table)
+            try:
+                total = transfer_rows(mysql_engine, pg_engine, pg_table, args.chunk_size, loader, metrics=metrics,
+                                      depth=args.pipeline_depth, batch_bytes=args.batch_mb << 20,
+                                      batch_latency=args.batch_latency)
+            except Exception as e:
+                error = str(e)
+                raise
+            finally:
+                records.append(metrics.finish(error).as_dict())
+            print(f"Метрики: {format_summary(records[-1])}")
     except Exception as e:
-        print(f"Ошибка при создании таблицы '{args.table}' в PostgreSQL: {e}")
+        print(f"Ошибка при переносе данных в PostgreSQL: {e}")
+        total = None
+    export_metrics(records, args.metrics_jsonl, args.metrics_prom)
+    if total is None:
         return
 
-    print("Извлекаем данные из MySQL...")
-    with mysql_engine.connect() as conn:
-        result = conn.execute(select(mysql_table))
-        # Используем mappings() для получения результатов в виде словарей
-        rows = result.mappings().all()
-    print(f"Извлечено {len(rows)} строк.")
+    report = []
+    if args.fast_load:
+        print("Переводим таблицу в журналируемую...")
+        report.extend(set_logged(pg_engine, [pg_table]))
+    if args.defer_indexes:
+        print("Строим первичный ключ и индексы после загрузки...")
+        report.extend(build_deferred(pg_engine, [pg_table], maintenance_work_mem=args.maintenance_work_mem))
+    report.extend(reset_sequences(pg_engine, [pg_table]))
+    print("Собираем статистику планировщика (ANALYZE)...")
+    report.extend(analyze_tables(pg_engine, [pg_table]))
+    print_build_report(report)
 
-    if not rows:
+    if not total:
         print("Данных для миграции не найдено.")
         return
 
-    data = list(rows)  # Уже список словарей
-
-    # Очищаем все строки от NUL-символов
-    sanitized_data = [sanitize_row(row) for row in data]
-
-    print("Вставляем данные в PostgreSQL...")
-    with pg_engine.begin() as conn:
-        try:
-            conn.execute(mysql_table.insert(), sanitized_data)
-        except Exception as e:
-            print(f"Ошибка при вставке данных в PostgreSQL: {e}")
-            return
-
     print("Миграция завершена успешно.")
 
 if __name__ == "__main__":
@@ -0,0 +1,166 @@
+# Потоковая загрузка строк в PostgreSQL через COPY ... FROM STDIN (текстовый формат).
+# Значения кодируются по типам отражённых столбцов: NULL передаётся как \N,
+# спецсимволы текста экранируются, двоичные данные пишутся в hex-формате bytea.
+
+import datetime
+import json
+
+from sqlalchemy import types as sqltypes
+
+COPY_NULL = "\\N"
+
+def copy_supported(engine):
+    """Возвращает True, если драйвер PostgreSQL поддерживает COPY (psycopg2)."""
+    return engine.dialect.name == "postgresql" and engine.dialect.driver == "psycopg2"
+
+def escape_copy_text(value):
+    """Экранирует строку для текстового формата COPY: обратный слеш, табуляцию и переводы строк."""
+    if "\\" in value:
+        value = value.replace("\\", "\\\\")
+    if "\t" in value:
+        value = value.replace("\t", "\\t")
+    if "\n" in value:
+        value = value.replace("\n", "\\n")
+    if "\r" in value:
+        value = value.replace("\r", "\\r")
+    return value
+
+def format_timedelta(value):
+    """Представляет timedelta (так pymysql возвращает MySQL TIME) в виде [-]HH:MM:SS[.ffffff]."""
+    total = value.days * 86400 + value.seconds
+    sign = ""
+    micro = value.microseconds
+    if total < 0:
+        sign = "-"
+        total = -total
+        if micro:
+            total -= 1
+            micro = 1000000 - micro
+    hours, rest = divmod(total, 3600)
+    minutes, seconds = divmod(rest, 60)
+    result = f"{sign}{hours:02d}:{minutes:02d}:{seconds:02d}"
+    if micro:
+        result += f".{micro:06d}"
+    return result
+
+def _encode_bytea(value):
+    if isinstance(value, str):
+        value = value.encode("utf-8")
+    # В текстовом COPY обратный слеш удваивается: \\x<hex>
+    return "\\\\x" + bytes(value).hex()
+
+def _encode_bool(value):
+    return "t" if value else "f"
+
+def _encode_temporal(value):
+    if isinstance(value, datetime.timedelta):
+        return format_timedelta(value)
+    return escape_copy_text(str(value))
+
+def _encode_json(value):
+    if isinstance(value, (bytes, bytearray)):
+        value = value.decode("utf-8")
+    if not isinstance(value, str):
+        value = json.dumps(value, ensure_ascii=False)
+    return escape_copy_text(value)
+
+def _encode_default(value):
+    if isinstance(value, str):
+        return escape_copy_text(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return escape_copy_text(bytes(value).decode("utf-8", errors="replace"))
+    if isinstance(value, bool):
+        return _encode_bool(value)
+    if isinstance(value, datetime.timedelta):
+        return format_timedelta(value)
+    if isinstance(value, (set, frozenset)):
+        # MySQL SET возвращается как множество строк
+        return escape_copy_text(",".join(sorted(value)))
+    return escape_copy_text(str(value))
+
+def column_encoder(col_type):
+    """Возвращает функцию, кодирующую значение (не None) столбца указанного типа для COPY."""
+    if isinstance(col_type, sqltypes.TypeDecorator):
+        col_type = col_type.impl_instance
+    if isinstance(col_type, sqltypes._Binary):
+        return _encode_bytea
+    if isinstance(col_type, sqltypes.Boolean):
+        return _encode_bool
+    if isinstance(col_type, sqltypes.JSON):
+        return _encode_json
+    if isinstance(col_type, (sqltypes.DateTime, sqltypes.Date, sqltypes.Time, sqltypes.Interval)):
+        return _encode_temporal
+    return _encode_default
+
+def build_row_encoder(columns):
+    """Компилирует кодировщик строки (последовательности значений в порядке columns) в строку COPY."""
+    encoders = [column_encoder(col.type) for col in columns]
+
+    def encode(row):
+        return "\t".join(
+            COPY_NULL if value is None else encoder(value)
+            for encoder, value in zip(encoders, row)
+        ) + "\n"
+
+    return encode
+
+class CopyStream:
+    """Файлоподобный объект, отдающий COPY-представление строк по мере чтения.
+
+    psycopg2 вызывает read(size) до получения пустой строки, поэтому в памяти
+    одновременно находится не больше одного блока данных.
+    """
+
+    def __init__(self, rows, encode):
+        self._rows = iter(rows)
+        self._encode = encode
+        self._pending = ""
+        self.row_count = 0
+
+    def read(self, size=-1):
+        parts = [self._pending]
+        length = len(self._pending)
+        for row in self._rows:
+            line = self._encode(row)
+            parts.append(line)
+            length += len(line)
+            self.row_count += 1
+            if 0 < size <= length:
+                break
+        data = "".join(parts)
+        if 0 < size < len(data):
+            self._pending = data[size:]
+            return data[:size]
+        self._pending = ""
+        return data
+
+def copy_statement(dialect, table, columns):
+    """Формирует текст COPY <table> (<columns>) FROM STDIN для указанного диалекта PostgreSQL."""
+    preparer = dialect.identifier_preparer
+    column_list = ", ".join(preparer.quote(col.name) for col in columns)
+    return f"COPY {preparer.format_table(table)} ({column_list}) FROM STDIN"
+
+def copy_rows(conn, table, rows, columns=None, buffer_size=1 << 20):
+    """Загружает строки (последовательности значений в порядке columns) в таблицу через COPY.
+
+    conn — соединение SQLAlchemy с PostgreSQL (psycopg2); транзакцией управляет вызывающий код.
+    Возвращает количество переданных строк.
+    """
+    if columns is None:
+        columns = list(table.columns)
+    stream = CopyStream(rows, build_row_encoder(columns))
+    cursor = conn.connection.cursor()
+    try:
+        cursor.copy_expert(copy_statement(conn.dialect, table, columns), stream, size=buffer_size)
+    finally:
+        cursor.close()
+    return stream.row_count
+
+def write_chunk(conn, table, rows, loader):
+    """Записывает порцию очищенных строк (последовательностей значений в порядке столбцов table)
+    в таблицу PostgreSQL через COPY или executemany."""
+    if loader == "copy":
+        copy_rows(conn, table, rows)
+    else:
+        names = [col.name for col in table.columns]
+        conn.execute(table.insert(), [dict(zip(names, row)) for row in rows])
@@ -0,0 +1,124 @@
+# Конвейер переноса порций: чтение из MySQL, очистка и запись в PostgreSQL перекрываются во времени.
+# Чтение и очистка выполняются в отдельных потоках, связанных очередями ограниченной длины:
+# когда запись не успевает, очереди заполняются и чтение приостанавливается (обратное давление),
+# поэтому в памяти одновременно находится не больше нескольких порций. Запись, контрольные точки
+# и транзакции остаются в вызывающем потоке и идут строго в порядке чтения.
+
+import queue
+import threading
+import time
+
+_DONE = object()
+_POLL = 0.1
+
+class _Failure:
+    """Исключение стадии, передаваемое по очереди в поток записи."""
+
+    def __init__(self, error):
+        self.error = error
+
+def _add_time(metrics, stage, started):
+    if metrics is not None:
+        metrics.stages[stage] = metrics.stages.get(stage, 0.0) + time.monotonic() - started
+
+def _put(output, item, stop):
+    """Кладёт элемент в очередь, ожидая свободного места; False, если конвейер остановлен."""
+    while not stop.is_set():
+        try:
+            output.put(item, timeout=_POLL)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _read(chunks, output, stop, metrics):
+    iterator = iter(chunks)
+    try:
+        while not stop.is_set():
+            started = time.monotonic()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                _put(output, _DONE, stop)
+                return
+            _add_time(metrics, "fetch", started)
+            if not _put(output, (chunk, started), stop):
+                return
+    except BaseException as e:
+        _put(output, _Failure(e), stop)
+    finally:
+        # Генератор порций держит подключение к MySQL: закрываем его в том же потоке, где читали
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            close()
+
+def _transform(source, output, transform, stop, metrics):
+    while not stop.is_set():
+        try:
+            item = source.get(timeout=_POLL)
+        except queue.Empty:
+            continue
+        if item is _DONE or isinstance(item, _Failure):
+            _put(output, item, stop)
+            return
+        chunk, fetch_started = item
+        started = time.monotonic()
+        try:
+            result = transform(chunk)
+        except BaseException as e:
+            _put(output, _Failure(e), stop)
+            return
+        _add_time(metrics, "transform", started)
+        if not _put(output, (chunk, result, fetch_started), stop):
+            return
+
+def _sequential(chunks, transform, metrics):
+    iterator = iter(chunks)
+    while True:
+        fetch_started = time.monotonic()
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        _add_time(metrics, "fetch", fetch_started)
+        started = time.monotonic()
+        result = transform(chunk)
+        _add_time(metrics, "transform", started)
+        yield chunk, result, fetch_started
+
+def pipeline(chunks, transform, depth=2, metrics=None):
+    """Генератор кортежей (порция, transform(порция), момент начала чтения порции) в порядке chunks.
+
+    Порции читаются из chunks и обрабатываются transform в фоновых потоках, пока вызывающий код
+    записывает предыдущие; depth — длина каждой из двух очередей между стадиями. При depth <= 0
+    стадии выполняются по очереди в вызывающем потоке. Время стадий (и простой записи
+    в ожидании данных — стадия wait) добавляется в metrics (TransferMetrics), если они заданы.
+    Ошибка чтения или очистки пробрасывается в вызывающий поток; при выходе из цикла записи
+    (в том числе по ошибке) фоновые потоки останавливаются."""
+    if depth <= 0:
+        yield from _sequential(chunks, transform, metrics)
+        return
+    stop = threading.Event()
+    fetched = queue.Queue(maxsize=depth)
+    transformed = queue.Queue(maxsize=depth)
+    threads = [
+        threading.Thread(target=_read, args=(chunks, fetched, stop, metrics), name="pipeline-read", daemon=True),
+        threading.Thread(target=_transform, args=(fetched, transformed, transform, stop, metrics),
+                         name="pipeline-transform", daemon=True),
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        while True:
+            started = time.monotonic()
+            item = transformed.get()
+            _add_time(metrics, "wait", started)
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,183 @@
+# Сравнение задержки запросов приложения в MySQL и PostgreSQL.
+# Каждый запрос из файла после прогрева выполняется заданное число раз в каждой базе с полным
+# чтением результата; по замерам считаются перцентили задержки и скорость в строках в секунду.
+# Для запросов, которые в PostgreSQL медленнее, чем в MySQL, сохраняются планы выполнения
+# (EXPLAIN (ANALYZE, BUFFERS) и EXPLAIN ANALYZE), а результаты пишутся в JSON.
+
+import datetime
+import json
+import re
+import time
+
+try:
+    from tabulate import tabulate
+except ImportError:
+    tabulate = None
+
+PERCENTILES = (50, 95, 99)
+
+_NAME = re.compile(r"^\s*--\s*name:\s*(\S+)", re.IGNORECASE)
+
+def load_queries(path):
+    """Читает файл запросов: запросы разделяются точкой с запятой в конце строки,
+    строка «-- name: <имя>» перед запросом задаёт его имя (по умолчанию q1, q2, ...).
+    Возвращает список пар (имя, текст запроса)."""
+    queries, lines, name = [], [], None
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            match = _NAME.match(line)
+            if match and not lines:
+                name = match.group(1)
+                continue
+            lines.append(line)
+            if line.rstrip().endswith(";"):
+                text = "".join(lines).strip().rstrip(";").strip()
+                if text:
+                    queries.append((name or f"q{len(queries) + 1}", text))
+                lines, name = [], None
+    text = "".join(lines).strip()
+    if text:
+        queries.append((name or f"q{len(queries) + 1}", text))
+    return queries
+
+def driver_sql(conn, query):
+    """Текст запроса для exec_driver_sql: при стиле параметров format/pyformat (psycopg2, pymysql)
+    драйвер получает пустой набор параметров и форматирует строку, поэтому проценты удваиваются."""
+    if conn.dialect.paramstyle in ("format", "pyformat"):
+        return query.replace("%", "%%")
+    return query
+
+def percentile(values, p):
+    """Перцентиль p (0–100) по методу ближайшего ранга."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[min(rank, len(ordered)) - 1]
+
+def run_once(conn, query):
+    """Выполняет запрос и читает результат целиком. Возвращает (время в секундах, число строк)."""
+    started = time.perf_counter()
+    result = conn.exec_driver_sql(driver_sql(conn, query))
+    rows = len(result.fetchall()) if result.returns_rows else 0
+    return time.perf_counter() - started, rows
+
+def measure(engine, query, runs, warmup):
+    """Прогревает запрос warmup раз (кэши СУБД и подключение) и замеряет runs выполнений
+    в одном подключении. Каждое выполнение — в своей транзакции, откатываемой после него.
+    Возвращает словарь с перцентилями задержки (мс), средней задержкой и строками в секунду."""
+    latencies, rows = [], 0
+    with engine.connect() as conn:
+        for i in range(warmup + runs):
+            with conn.begin() as transaction:
+                elapsed, rows = run_once(conn, query)
+                transaction.rollback()
+            if i >= warmup:
+                latencies.append(elapsed)
+    mean = sum(latencies) / len(latencies)
+    result = {f"p{p}_ms": percentile(latencies, p) * 1000 for p in PERCENTILES}
+    result.update(mean_ms=mean * 1000, rows=rows, rows_per_second=rows / mean if mean > 0 else 0.0)
+    return result
+
+def explain(engine, query):
+    """Фактический план выполнения запроса: EXPLAIN (ANALYZE, BUFFERS) в PostgreSQL,
+    EXPLAIN ANALYZE в MySQL (8.0.18+), EXPLAIN QUERY PLAN в прочих СУБД.
+    Запрос выполняется в транзакции, которая откатывается."""
+    prefix = {"postgresql": "EXPLAIN (ANALYZE, BUFFERS) ", "mysql": "EXPLAIN ANALYZE "}.get(
+        engine.dialect.name, "EXPLAIN QUERY PLAN ")
+    with engine.connect() as conn, conn.begin() as transaction:
+        rows = conn.exec_driver_sql(driver_sql(conn, prefix + query)).fetchall()
+        transaction.rollback()
+    return "\n".join(" ".join(str(value) for value in row) for row in rows)
+
+def run_benchmark(engines, queries, runs=20, warmup=3, threshold=1.2, log=print):
+    """Замеряет каждый запрос во всех базах engines ({метка: engine}, первой — MySQL, второй —
+    PostgreSQL). Запрос считается регрессией, если p95 во второй базе больше, чем в первой,
+    в threshold раз и более; для регрессий сохраняются планы обеих баз.
+    Возвращает словарь результатов для сохранения в JSON."""
+    labels = list(engines)
+    results = {
+        "started_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "runs": runs,
+        "warmup": warmup,
+        "threshold": threshold,
+        "databases": labels,
+        "queries": {},
+    }
+    for name, query in queries:
+        entry = {"query": query}
+        for label, engine in engines.items():
+            log(f"{name}: {label}, прогрев {warmup}, замеров {runs}...")
+            try:
+                entry[label] = measure(engine, query, runs, warmup)
+            except Exception as e:
+                entry[label] = {"error": str(getattr(e, "orig", None) or e).strip()}
+        base, target = (entry[label] for label in labels[:2])
+        entry["ratio"] = None
+        if "error" not in base and "error" not in target and base["p95_ms"] > 0:
+            entry["ratio"] = target["p95_ms"] / base["p95_ms"]
+        entry["regression"] = entry["ratio"] is not None and entry["ratio"] >= threshold
+        if entry["regression"]:
+            entry["plans"] = {}
+            for label, engine in engines.items():
+                try:
+                    entry["plans"][label] = explain(engine, query)
+                except Exception as e:
+                    entry["plans"][label] = f"не удалось получить план: {str(getattr(e, 'orig', None) or e).strip()}"
+        results["queries"][name] = entry
+    return results
+
+def _cell(measurement, key, fmt):
+    if "error" in measurement:
+        return "ошибка"
+    return fmt.format(measurement[key])
+
+def print_report(results, baseline=None):
+    """Выводит задержки и скорость запросов в обеих базах рядом, планы регрессий и,
+    если задан baseline (результаты прошлого запуска), изменение p95 во второй базе."""
+    first, second = results["databases"][:2]
+    output_data = []
+    for name, entry in results["queries"].items():
+        row = [name]
+        for label in (first, second):
+            measurement = entry[label]
+            row.extend(_cell(measurement, f"p{p}_ms", "{:.2f}") for p in PERCENTILES)
+            row.append(_cell(measurement, "rows_per_second", "{:.0f}"))
+        row.append("—" if entry["ratio"] is None else f"{entry['ratio']:.2f}")
+        if baseline is not None:
+            previous = baseline.get("queries", {}).get(name, {}).get(second, {})
+            current = entry[second]
+            if previous.get("p95_ms") and "error" not in current:
+                row.append(f"{current['p95_ms'] / previous['p95_ms']:.2f}")
+            else:
+                row.append("—")
+        row.append("регрессия" if entry["regression"] else ("ошибка" if entry["ratio"] is None else "норма"))
+        output_data.append(row)
+    headers = ["Запрос"]
+    for label in (first, second):
+        headers.extend(f"{label} p{p}, мс" for p in PERCENTILES)
+        headers.append(f"{label} строк/с")
+    headers.append(f"p95 {second}/{first}")
+    if baseline is not None:
+        headers.append("p95 к прошлому запуску")
+    headers.append("Статус")
+    print()
+    if tabulate:
+        print(tabulate(output_data, headers=headers, tablefmt="psql"))
+    else:
+        print("\t".join(headers))
+        for row in output_data:
+            print("\t".join(str(value) for value in row))
+    for name, entry in results["queries"].items():
+        for label, measurement in ((label, entry[label]) for label in (first, second)):
+            if "error" in measurement:
+                print(f"\n{name} ({label}): ошибка: {measurement['error']}")
+        for label, plan in entry.get("plans", {}).items():
+            print(f"\nПлан {name} ({label}):\n{plan}")
+    regressions = sum(1 for entry in results["queries"].values() if entry["regression"])
+    print(f"\nЗапросов: {len(results['queries'])}, регрессий (p95 {second} ≥ {results['threshold']} × {first}): "
+          f"{regressions}")
+
+def save_results(results, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,61 @@
+# Очистка значений перед записью в PostgreSQL, который не принимает NUL (0x00) в текстовых полях
+# и нулевые даты MySQL. План очистки компилируется один раз по типам столбцов PostgreSQL:
+# строки обрабатываются как последовательности значений, а затрагиваются только столбцы,
+# которым очистка нужна.
+
+from sqlalchemy import types as sqltypes
+
+def clean_text(value):
+    """Удаляет NUL-символы из значения текстового столбца; байты предварительно декодируются из UTF-8."""
+    if isinstance(value, (bytes, bytearray)):
+        value = bytes(value).decode("utf-8", errors="ignore")
+    return value.replace("\0", "")
+
+def clean_temporal(value):
+    """Дата или время, которые драйвер не смог разобрать (нулевые даты '0000-00-00' pymysql
+    возвращает строкой), переносятся как NULL."""
+    return None if isinstance(value, str) else value
+
+def _impl(col_type):
+    if isinstance(col_type, sqltypes.TypeDecorator):
+        return col_type.impl_instance
+    return col_type
+
+def is_text_type(col_type):
+    """True для строковых типов (CHAR, VARCHAR, TEXT, ENUM и т.п.); двоичные типы сюда не входят:
+    bytea хранит NUL без ограничений."""
+    col_type = _impl(col_type)
+    return isinstance(col_type, sqltypes.String) and not isinstance(col_type, sqltypes._Binary)
+
+def column_cleaner(col_type):
+    """Возвращает функцию очистки значения (не None) столбца указанного типа или None,
+    если значения столбца передаются без изменений."""
+    col_type = _impl(col_type)
+    if is_text_type(col_type):
+        return clean_text
+    if isinstance(col_type, sqltypes.Boolean):
+        # TINYINT(1) приходит из MySQL числом
+        return bool
+    if isinstance(col_type, (sqltypes.DateTime, sqltypes.Date)):
+        return clean_temporal
+    return None
+
+def build_row_sanitizer(columns):
+    """Компилирует очистку строки — последовательности значений в порядке columns.
+    Очищаются только текстовые столбцы (NUL), логические (числа MySQL) и даты (нулевые даты);
+    остальные значения передаются без изменений и без проверки типа.
+    Если очищать нечего, строка возвращается как есть."""
+    plan = [(i, cleaner) for i, cleaner in
+            ((i, column_cleaner(col.type)) for i, col in enumerate(columns)) if cleaner]
+    if not plan:
+        return lambda row: row
+
+    def sanitize(row):
+        values = list(row)
+        for i, cleaner in plan:
+            value = values[i]
+            if value is not None:
+                values[i] = cleaner(value)
+        return values
+
+    return sanitize
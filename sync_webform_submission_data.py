@@ -1,123 +1,361 @@
 #!/usr/bin/env python3
 # Команда для запуска с удалением существующей таблицы:
 # python sync_webform_submission_data.py --table webform_submission_data --drop
+# Досинхронизация недостающих строк по составному ключу с выборкой целыми отправками (по sid):
+# python sync_webform_submission_data.py --key sid,name,property,delta --group-key sid
+# То же с построением индекса по ключу в PostgreSQL (CREATE INDEX CONCURRENTLY) для чтения ключей из индекса:
+# python sync_webform_submission_data.py --key sid,name,property,delta --key-index
+# Сравнение на стороне PostgreSQL через временную таблицу (COPY порции + INSERT ... WHERE NOT EXISTS):
+# python sync_webform_submission_data.py --staging rows --batch-size 50000
+# Инкрементальная синхронизация строк, изменённых с прошлого запуска (по webform_submission.changed):
+# python sync_webform_submission_data.py --incremental
+# Инкрементальная синхронизация по монотонно растущему столбцу самой таблицы:
+# python sync_webform_submission_data.py --incremental --watermark-table "" --watermark-column sid
 
 #!/usr/bin/env python3
 import argparse
 import sys
-from sqlalchemy import create_engine, text
+import time
+from sqlalchemy import (inspect, select, func, or_, and_, exists, text, tuple_, Column, MetaData, Table,
+                        table as sql_table, column)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from pg_copy import copy_rows, copy_supported
+from connections import make_engine
+from key_diff import KeyDiff, ensure_key_index
+from key_ranges import get_key_columns, iter_chunks
+from sanitize import build_row_sanitizer
+from checkpoint import ensure_watermark_table, load_watermark, save_watermark
+from metrics import TransferMetrics, format_summary, export_metrics
 
-def get_primary_key_mysql(engine, table):
+WATERMARK_LABEL = "_watermark"
+STAGING_TABLE = "sync_staging"
+
+def resolve_key_columns(engine, table, key_columns, db_label):
+    """
+    Проверяет, что столбцы ключа есть в таблице. Если ключ не задан или каких-то столбцов нет,
+    берёт первичный ключ (или уникальный индекс без NULL) — возможно, составной, — а если нет
+    и его, то столбец 'sid'. Возвращает список столбцов, по которым сравниваются ключи.
+    """
+    try:
+        inspector = inspect(engine)
+        columns = {col["name"] for col in inspector.get_columns(table)}
+    except Exception as e:
+        print(f"Ошибка при получении столбцов таблицы '{table}' в {db_label}:\n{e}")
+        sys.exit(1)
+    if key_columns and all(name in columns for name in key_columns):
+        return list(key_columns)
+    if key_columns:
+        absent = [name for name in key_columns if name not in columns]
+        print(f"Не найдены столбцы {', '.join(absent)} в таблице '{table}' в {db_label}.")
+    print("Определяем ключ таблицы автоматически...")
+    key = get_key_columns(inspector, table) or (["sid"] if "sid" in columns else None)
+    if key is None:
+        print(f"Не удалось обнаружить первичный ключ для таблицы '{table}' в {db_label}.")
+        sys.exit(1)
+    print(f"Обнаружен ключ: ({', '.join(key)}).")
+    return key
+
+def group_first(key_columns, other_columns, group_column):
     """
-    Определяет имя первичного ключа в MySQL для указанной таблицы.
+    Переставляет столбец группировки в начало ключа (и соответствующий ему столбец ключа
+    другой базы — на то же место). Ключи одной группы (одной отправки формы) тогда идут
+    в отсортированном потоке подряд. Возвращает оба списка и индекс группы (0 или None).
+    """
+    if not group_column or group_column not in key_columns:
+        return key_columns, other_columns, None
+    i = key_columns.index(group_column)
+    order = [i] + [j for j in range(len(key_columns)) if j != i]
+    return [key_columns[j] for j in order], [other_columns[j] for j in order], 0
+
+def batch_key_groups(keys, batch_size, group_index=None):
+    """
+    Делит отсортированный поток ключей (кортежей) на порции около batch_size ключей.
+    При заданном group_index порция заканчивается только на границе группы, поэтому строки
+    одной отправки формы читаются одним запросом и записываются одной транзакцией.
+    """
+    batch = []
+    for key in keys:
+        if len(batch) >= batch_size and (group_index is None or key[group_index] != batch[-1][group_index]):
+            yield batch
+            batch = []
+        batch.append(key)
+    if batch:
+        yield batch
+
+def split_key_runs(keys, min_run):
     """
-    with engine.connect() as conn:
-        result = conn.execute(text(f"SHOW KEYS FROM {table} WHERE Key_name = 'PRIMARY'")).mappings().all()
-        if result:
-            return result[0]["Column_name"]
+    Делит отсортированные ключи на непрерывные диапазоны целых чисел длиной не меньше min_run
+    (их выгоднее выбирать через BETWEEN) и отдельные значения (выбираются через IN).
+    """
+    runs, singles, run = [], [], []
+
+    def flush():
+        if len(run) >= min_run:
+            runs.append((run[0], run[-1]))
         else:
-            return None
-
-def get_primary_key_pg(engine, table):
-    """
-    Определяет имя первичного ключа в PostgreSQL для указанной таблицы,
-    используя information_schema. Если не найден стандартным способом, проверяет наличие столбца 'sid'.
-    """
-    with engine.connect() as conn:
-        query = text("""
-            SELECT kcu.column_name
-            FROM information_schema.table_constraints tc
-            JOIN information_schema.key_column_usage kcu
-              ON tc.constraint_name = kcu.constraint_name
-            WHERE tc.table_name = :table AND tc.constraint_type = 'PRIMARY KEY'
-            LIMIT 1
-        """)
-        result = conn.execute(query, {"table": table}).mappings().all()
-        if result:
-            return result[0]["column_name"]
+            singles.extend(run)
+
+    for key in keys:
+        if run and isinstance(key, int) and isinstance(run[-1], int) and key == run[-1] + 1:
+            run.append(key)
         else:
-            col_query = text("SELECT column_name FROM information_schema.columns WHERE table_name = :table")
-            cols = {row["column_name"] for row in conn.execute(col_query, {"table": table}).mappings().all()}
-            if "sid" in cols:
-                return "sid"
-            else:
-                return None
+            flush()
+            run = [key]
+    flush()
+    return runs, singles
+
+def fetch_rows_by_keys(conn, table, key_columns, keys, column_names, group_index=None, min_run=16):
+    """
+    Получает из таблицы одним запросом строки с ключами (кортежами значений key_columns) из keys.
+    Одностолбцовые ключи выбираются через BETWEEN для непрерывных диапазонов и IN (...) для
+    остальных; составные — через (k1, k2, ...) IN (...). При заданном group_index выбираются
+    целиком группы (например, все строки отправок формы по sid — диапазонами и IN по индексу),
+    а лишние строки групп отбрасываются по полному ключу.
+    Возвращает список строк — кортежей значений в порядке column_names.
+    """
+    tbl = sql_table(table, *[column(name) for name in dict.fromkeys([*column_names, *key_columns])])
+    key = [tbl.c[name] for name in key_columns]
+    if len(key) == 1 or group_index is not None:
+        group = key[group_index or 0]
+        runs, singles = split_key_runs(sorted({k[group_index or 0] for k in keys}), min_run)
+        conditions = [group.between(lo, hi) for lo, hi in runs]
+        if singles:
+            conditions.append(group.in_(singles))
+        condition = or_(*conditions)
+    else:
+        condition = tuple_(*key).in_(keys)
+    query = select(*[tbl.c[name] for name in column_names], *key).where(condition)
+    wanted = set(keys)
+    width = len(column_names)
+    return [tuple(row[:width]) for row in conn.execute(query) if tuple(row[width:]) in wanted]
+
+def write_rows_pg(conn, table, columns, rows, loader):
+    """
+    Записывает список очищенных строк (последовательностей значений в порядке columns)
+    в таблицу PostgreSQL через COPY или executemany.
+    """
+    if loader == "copy":
+        copy_rows(conn, table, rows, columns)
+    else:
+        names = [col.name for col in columns]
+        conn.execute(table.insert(), [dict(zip(names, row)) for row in rows])
 
-def get_all_keys(engine, table, key_column, db_label):
+def insert_batch_pg(conn, table, columns, rows, loader, key_columns):
     """
-    Возвращает множество значений ключевого столбца из таблицы.
-    Если возникает ошибка (например, столбец не найден), пытается определить первичный ключ автоматически.
+    Вставляет порцию строк в одной транзакции. Если транзакция не удалась,
+    порция делится пополам и половины вставляются отдельно — так ошибочные строки
+    изолируются за O(log n) попыток, а остальные всё равно попадают в PostgreSQL.
+    Возвращает количество вставленных строк.
     """
     try:
-        with engine.connect() as conn:
-            query = text(f"SELECT {key_column} FROM {table}")
-            result = conn.execute(query)
-            keys = {row[0] for row in result}
-        return keys
+        with conn.begin():
+            write_rows_pg(conn, table, columns, rows, loader)
+        return len(rows)
     except Exception as e:
-        err_str = str(e)
-        if ("Unknown column" in err_str) or ("does not exist" in err_str):
-            print(f"Не найден столбец '{key_column}' в таблице '{table}' в {db_label}.")
-            print("Пытаемся определить первичный ключ автоматически...")
-            if db_label == "MySQL":
-                pk = get_primary_key_mysql(engine, table)
-            else:
-                pk = get_primary_key_pg(engine, table)
-            if pk is None:
-                print(f"Не удалось обнаружить первичный ключ для таблицы '{table}' в {db_label}.")
-                sys.exit(1)
-            print(f"Обнаружен первичный ключ: '{pk}'. Повторяем запрос с этим столбцом...")
-            with engine.connect() as conn:
-                query = text(f"SELECT {pk} FROM {table}")
-                result = conn.execute(query)
-                keys = {row[0] for row in result}
-            return keys
-        else:
-            print(f"Ошибка при получении ключей из таблицы '{table}' в {db_label} с использованием столбца '{key_column}':\n{e}")
-            sys.exit(1)
+        if len(rows) == 1:
+            names = [col.name for col in columns]
+            key_value = tuple(rows[0][names.index(name)] if name in names else None for name in key_columns)
+            print(f"Ошибка при вставке записи с ключом {key_value} в PostgreSQL: {e}")
+            return 0
+        middle = len(rows) // 2
+        return (insert_batch_pg(conn, table, columns, rows[:middle], loader, key_columns)
+                + insert_batch_pg(conn, table, columns, rows[middle:], loader, key_columns))
 
-def fetch_rows_by_key(engine, table, key_column, key_value):
+def upsert_batch_pg(conn, table, rows):
     """
-    Получает из таблицы все строки, удовлетворяющие условию key_column = key_value.
-    Возвращает список строк (каждая строка — словарь).
+    Применяет порцию строк через INSERT ... ON CONFLICT (первичный ключ) DO UPDATE:
+    новые строки вставляются, уже существующие обновляются значениями из источника.
     """
-    with engine.connect() as conn:
-        query = text(f"SELECT * FROM {table} WHERE {key_column} = :key_val")
-        results = conn.execute(query, {"key_val": key_value}).mappings().all()
-        return [dict(row) for row in results]
+    key_columns = [col.name for col in table.primary_key.columns]
+    statement = pg_insert(table)
+    updates = {col.name: statement.excluded[col.name] for col in table.columns if col.name not in key_columns}
+    if updates:
+        statement = statement.on_conflict_do_update(index_elements=key_columns, set_=updates)
+    else:
+        statement = statement.on_conflict_do_nothing(index_elements=key_columns)
+    conn.execute(statement, rows)
 
-def sanitize_row(row):
+def watermark_source(table, column_names, watermark_column, watermark_table=None, join_key="sid"):
     """
-    Проходит по всем полям строки (словаря) и, если значение является строкой,
-    удаляет все NUL (0x00) символы.
+    Возвращает таблицу-источник (с соединением, если нужно) и выражение отметки.
+    Если задана watermark_table, отметка берётся из родительской таблицы (например,
+    webform_submission.changed), соединённой с table по join_key; иначе watermark_column —
+    монотонно растущий столбец самой таблицы.
     """
-    sanitized = {}
-    for key, value in row.items():
-        if isinstance(value, str):
-            sanitized[key] = value.replace('\0', '')
-        else:
-            sanitized[key] = value
-    return sanitized
+    src = sql_table(table, *[column(name) for name in column_names])
+    if not watermark_table:
+        return src, src, src.c[watermark_column]
+    parent = sql_table(watermark_table, column(join_key), column(watermark_column))
+    return src, src.join(parent, src.c[join_key] == parent.c[join_key]), parent.c[watermark_column]
 
-def insert_row_pg(engine, table, row_dict):
+def sync_incremental(args, mysql_engine, pg_engine, metrics):
     """
-    Вставляет строку (словарь с данными) в таблицу PostgreSQL.
-    Перед вставкой очищает строковые поля от NUL-символов.
-    Формирует запрос INSERT, используя имена столбцов из row_dict.
+    Переносит из MySQL только строки, изменённые с прошлого запуска (отметка >= сохранённой),
+    и применяет их через upsert, поэтому время работы пропорционально объёму изменений.
+    Отметка сохраняется в PostgreSQL в одной транзакции с каждой порцией: прерванный запуск
+    продолжается с последней применённой порции. Время стадий учитывается в metrics.
     """
-    if not row_dict:
+    pg_table = Table(args.table, MetaData(), autoload_with=pg_engine)
+    if not pg_table.primary_key.columns:
+        print(f"У таблицы '{args.table}' в PostgreSQL нет первичного ключа: upsert невозможен.")
+        sys.exit(1)
+    mysql_columns = {col["name"] for col in inspect(mysql_engine).get_columns(args.table)}
+    column_names = [col.name for col in pg_table.columns if col.name in mysql_columns]
+    src, source, mark = watermark_source(args.table, column_names, args.watermark_column,
+                                         args.watermark_table, args.join_key)
+    # Очистка от NUL-символов компилируется один раз по типам столбцов таблицы в PostgreSQL
+    sanitize = build_row_sanitizer([pg_table.c[name] for name in column_names])
+    state_key = f"{args.watermark_table}.{args.watermark_column}" if args.watermark_table else args.watermark_column
+
+    ensure_watermark_table(pg_engine)
+    with pg_engine.begin() as conn:
+        since = load_watermark(conn, args.table, state_key)
+    if args.since is not None:
+        since = args.since
+    # Верхняя граница фиксируется до чтения: строки, изменённые во время синхронизации,
+    # попадут в следующий запуск
+    with mysql_engine.connect() as conn:
+        until = conn.execute(select(func.max(mark)).select_from(source)).scalar()
+    if until is None:
+        print(f"В таблице '{args.table}' нет строк для синхронизации.")
         return
-    sanitized_row = sanitize_row(row_dict)
-    columns = sanitized_row.keys()
-    columns_str = ", ".join(columns)
-    placeholders = ", ".join(f":{col}" for col in columns)
-    insert_stmt = text(f"INSERT INTO {table} ({columns_str}) VALUES ({placeholders})")
-    with engine.begin() as conn:
-        conn.execute(insert_stmt, sanitized_row)
+    if since is None:
+        print(f"Отметка {state_key} не найдена: первая синхронизация переносит все строки до {until}.")
+    else:
+        print(f"Переносим строки с отметкой {state_key} от {since} до {until}.")
+
+    # Строки с отметкой, равной сохранённой, читаются повторно: изменения в ту же секунду
+    # не теряются, а повторное применение upsert безопасно
+    query = select(*src.c, mark.label(WATERMARK_LABEL)).select_from(source).where(mark <= until)
+    if since is not None:
+        query = query.where(mark >= since)
+    query = query.order_by(mark)
+
+    synced = 0
+    with mysql_engine.connect() as mysql_conn, pg_engine.connect() as pg_conn:
+        result = mysql_conn.execution_options(
+            stream_results=True, max_row_buffer=args.batch_size
+        ).execute(query)
+        for partition in metrics.timed(result.partitions(args.batch_size)):
+            with metrics.stage("transform"):
+                rows = [sanitize(row) for row in partition]
+            # Отметка — последний столбец выборки
+            watermark = partition[-1][-1]
+            with metrics.stage("write"), pg_conn.begin():
+                upsert_batch_pg(pg_conn, pg_table, [dict(zip(column_names, row)) for row in rows])
+                synced += len(rows)
+                save_watermark(pg_conn, args.table, state_key, watermark, synced)
+            metrics.add_batch(rows)
+            print(f"Применено изменённых строк: {synced} (отметка {watermark})")
+        with pg_conn.begin():
+            save_watermark(pg_conn, args.table, state_key, until, synced)
+    print(f"\nСинхронизировано {synced} строк, новая отметка {state_key}: {until}.")
+
+def resolve_keys(args, mysql_engine, pg_engine):
+    """
+    Определяет столбцы ключа в MySQL и PostgreSQL (--key или первичный ключ) и ставит столбец
+    --group-key первым. Возвращает (ключ в MySQL, ключ в PostgreSQL, индекс группы или None).
+    """
+    key_columns = [name.strip() for name in args.key.split(",")] if args.key else None
+    mysql_key = resolve_key_columns(mysql_engine, args.table, key_columns, "MySQL")
+    # Без --key столбцы ключа в PostgreSQL те же, что в MySQL, и в том же порядке
+    pg_key = resolve_key_columns(pg_engine, args.table, key_columns or mysql_key, "PostgreSQL")
+    if len(mysql_key) != len(pg_key):
+        print(f"Ключи в MySQL ({', '.join(mysql_key)}) и PostgreSQL ({', '.join(pg_key)}) "
+              "состоят из разного числа столбцов.")
+        sys.exit(1)
+    return group_first(mysql_key, pg_key, args.group_key)
+
+def staging_table(columns, name=STAGING_TABLE):
+    """
+    Временная таблица PostgreSQL со столбцами columns (без ограничений). ON COMMIT DELETE ROWS
+    очищает её при фиксации каждой порции, поэтому она не растёт и не требует TRUNCATE.
+    """
+    return Table(name, MetaData(), *[Column(col.name, col.type) for col in columns],
+                 prefixes=["TEMPORARY"], postgresql_on_commit="DELETE ROWS")
+
+def anti_join(staging, target, key_columns):
+    """Условие «строки staging нет в target» по столбцам ключа: NOT EXISTS (...)."""
+    return ~exists().where(and_(*[target.c[name] == staging.c[name] for name in key_columns]))
+
+def sync_staging(args, mysql_engine, pg_engine, pg_table, columns, mysql_key, pg_key, group_index, loader,
+                 metrics):
+    """
+    Досинхронизация через временную таблицу в PostgreSQL. Источник читается порциями по ключу,
+    порция загружается в таблицу через COPY, а сравнение с приёмником выполняет сам PostgreSQL
+    одним анти-соединением (NOT EXISTS, хеш- или merge-join) на порцию, поэтому ключи всей
+    таблицы не собираются ни в Python, ни в двух отсортированных потоках.
+    --staging rows: в таблицу загружаются строки целиком и вставляются одним
+    INSERT ... SELECT ... WHERE NOT EXISTS ... ON CONFLICT DO NOTHING.
+    --staging keys: загружаются только ключи; недостающие ключи порции возвращаются в Python,
+    и из MySQL читаются только их строки (удобно, когда расхождений мало, а строки широкие).
+    """
+    names = [col.name for col in columns]
+    page_key = get_key_columns(inspect(mysql_engine), args.table)
+    rows_mode = args.staging == "rows"
+    if rows_mode:
+        source_columns, staged = names, columns
+    else:
+        # Столбцы ключа постраничного чтения читаются вместе с ключом сравнения
+        source_columns = list(dict.fromkeys([*mysql_key, *(page_key or [])]))
+        staged = [pg_table.c[name] for name in pg_key]
+    if page_key and not all(name in source_columns for name in page_key):
+        page_key = None
+    staging = staging_table(staged)
+    sanitize_staged = build_row_sanitizer(staged)
+    sanitize_row = build_row_sanitizer(columns)
+    projection = [source_columns.index(name) for name in (names if rows_mode else mysql_key)]
+    condition = anti_join(staging, pg_table, pg_key)
+    if rows_mode:
+        apply = (pg_insert(pg_table)
+                 .from_select(names, select(*[staging.c[name] for name in names]).where(condition))
+                 .on_conflict_do_nothing())
+    else:
+        apply = select(*staging.c).where(condition)
+    print(f"Сравниваем порции по {args.batch_size} строк через временную таблицу {STAGING_TABLE} "
+          f"({'строки целиком' if rows_mode else 'только ключи'}).")
+
+    scanned, missing, inserted = 0, 0, 0
+    chunks = iter_chunks(mysql_engine, args.table, source_columns, page_key, args.batch_size)
+    with mysql_engine.connect() as mysql_conn, pg_engine.connect() as pg_conn:
+        staging.create(pg_conn)
+        pg_conn.commit()
+        for chunk in metrics.timed(chunks):
+            batch_started = metrics.fetch_started
+            with metrics.stage("transform"):
+                staged_rows = [sanitize_staged([row[i] for i in projection]) for row in chunk]
+            scanned += len(staged_rows)
+            with metrics.stage("write"), pg_conn.begin():
+                write_rows_pg(pg_conn, staging, staged, staged_rows, loader)
+                # Временные таблицы не анализируются автоматически: без статистики планировщик
+                # не выберет хеш-соединение для крупной порции
+                pg_conn.execute(text(f"ANALYZE {STAGING_TABLE}"))
+                result = pg_conn.execute(apply)
+                keys = None if rows_mode else [tuple(row) for row in result]
+            if rows_mode:
+                missing += result.rowcount
+                inserted += result.rowcount
+            elif keys:
+                missing += len(keys)
+                # Строки недостающих ключей читаются из MySQL и записываются как в обычном режиме
+                with metrics.stage("fetch"):
+                    rows = fetch_rows_by_keys(mysql_conn, args.table, mysql_key, keys, names, group_index)
+                with metrics.stage("transform"):
+                    rows = [sanitize_row(row) for row in rows]
+                with metrics.stage("write"):
+                    inserted += insert_batch_pg(pg_conn, pg_table, columns, rows, loader, mysql_key)
+            metrics.add_batch(staged_rows, batch_started)
+            print(f"Проверено строк источника: {scanned}, недостающих: {missing}, вставлено: {inserted}")
+    print(f"\nПроверено строк в MySQL: {scanned}")
+    if missing:
+        print(f"Найдено {missing} недостающих строк, вставлено {inserted} записей в PostgreSQL.")
+    else:
+        print("Нет недостающих записей для синхронизации.")
 
 def main():
     parser = argparse.ArgumentParser(
-        description="Синхронизирует данные таблицы между MySQL и PostgreSQL, добавляя недостающие записи."
+        description="Синхронизирует данные таблицы между MySQL и PostgreSQL, добавляя недостающие записи "
+                    "или (с --incremental) применяя изменения с прошлого запуска."
     )
     parser.add_argument(
         "--table",
@@ -128,8 +366,31 @@ def main():
     parser.add_argument(
         "--key",
         type=str,
-        default="id",
-        help="Имя ключевого столбца (по умолчанию: id). Если его нет, скрипт определит первичный ключ автоматически."
+        default=None,
+        help="Столбец ключа или несколько через запятую для составного ключа "
+             "(по умолчанию: первичный ключ таблицы в MySQL, например sid, name, property, delta)"
+    )
+    parser.add_argument(
+        "--group-key",
+        type=str,
+        default="sid",
+        help="Столбец ключа, по значениям которого недостающие строки выбираются и записываются группами "
+             "(все строки одной отправки формы — одним запросом); пустая строка — без группировки (по умолчанию: sid)"
+    )
+    parser.add_argument(
+        "--staging",
+        choices=["rows", "keys"],
+        default=None,
+        help="Сравнивать на стороне PostgreSQL: порции источника загружаются через COPY во временную таблицу "
+             "и сравниваются с приёмником анти-соединением; rows — строки целиком (INSERT ... SELECT ... "
+             "WHERE NOT EXISTS), keys — только ключи, недостающие строки читаются из MySQL "
+             "(по умолчанию: слияние отсортированных потоков ключей)"
+    )
+    parser.add_argument(
+        "--key-index",
+        action="store_true",
+        help="Создать в PostgreSQL индекс по ключу для чтения ключей только из индекса; строится через "
+             "CREATE INDEX CONCURRENTLY и не блокирует запись (по умолчанию: не создавать)"
     )
     parser.add_argument(
         "--mysql",
@@ -143,45 +404,139 @@ def main():
         default="postgresql+psycopg2://postgres@localhost/hexly_proj",
         help="Строка подключения к PostgreSQL (по умолчанию: postgresql+psycopg2://postgres@localhost/hexly_proj)"
     )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1000,
+        help="Количество ключей, выбираемых из MySQL одним запросом и вставляемых одной транзакцией (по умолчанию: 1000)"
+    )
+    parser.add_argument(
+        "--loader",
+        choices=["copy", "insert"],
+        default=None,
+        help="Способ записи в PostgreSQL: copy (COPY FROM STDIN) или insert (executemany). "
+             "По умолчанию copy для драйвера psycopg2, иначе insert."
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Переносить только строки, изменённые с прошлого запуска, и применять их через "
+             "INSERT ... ON CONFLICT DO UPDATE вместо поиска недостающих ключей."
+    )
+    parser.add_argument(
+        "--watermark-column",
+        type=str,
+        default="changed",
+        help="Столбец отметки изменений для --incremental (по умолчанию: changed)"
+    )
+    parser.add_argument(
+        "--watermark-table",
+        type=str,
+        default="webform_submission",
+        help="Таблица, из которой берётся отметка, соединяемая по --join-key; пустая строка — столбец "
+             "самой синхронизируемой таблицы (по умолчанию: webform_submission)"
+    )
+    parser.add_argument(
+        "--join-key",
+        type=str,
+        default="sid",
+        help="Столбец соединения с таблицей отметки (по умолчанию: sid)"
+    )
+    parser.add_argument(
+        "--since",
+        type=str,
+        default=None,
+        help="Начальное значение отметки вместо сохранённого в PostgreSQL (по умолчанию: сохранённое)"
+    )
+    parser.add_argument(
+        "--metrics-jsonl",
+        type=str,
+        default=None,
+        help="Дописывать метрики синхронизации в файл JSON Lines (по умолчанию: не записывать)"
+    )
+    parser.add_argument(
+        "--metrics-prom",
+        type=str,
+        default=None,
+        help="Записывать метрики в текстовый файл Prometheus для textfile collector (по умолчанию: не записывать)"
+    )
     args = parser.parse_args()
 
     # Создаём движки подключения
-    mysql_engine = create_engine(args.mysql)
-    pg_engine = create_engine(args.postgres)
-
-    # Получаем ключи из обеих баз
-    mysql_keys = get_all_keys(mysql_engine, args.table, args.key, "MySQL")
-    pg_keys = get_all_keys(pg_engine, args.table, args.key, "PostgreSQL")
-
-    print(f"Общее количество строк в MySQL (по ключам): {len(mysql_keys)}")
-    print(f"Общее количество строк в PostgreSQL (по ключам): {len(pg_keys)}")
-
-    missing_in_pg = mysql_keys - pg_keys
-    print(f"\nНайдено {len(missing_in_pg)} недостающих записей в PostgreSQL.")
-
-    if missing_in_pg:
-        # Определяем имя первичного ключа для MySQL
-        pk_mysql = args.key
-        if not any(str(k) == pk_mysql for k in mysql_keys):
-            pk_mysql = get_primary_key_mysql(mysql_engine, args.table)
-            if pk_mysql is None:
-                pk_mysql = "sid"
-        print(f"Используем в MySQL первичный ключ: '{pk_mysql}'")
-        count_inserted = 0
-        for missing_key in sorted(missing_in_pg):
-            rows = fetch_rows_by_key(mysql_engine, args.table, pk_mysql, missing_key)
+    mysql_engine = make_engine(args.mysql)
+    pg_engine = make_engine(args.postgres)
+    metrics = TransferMetrics("sync_webform_submission_data", args.table, "incremental" if args.incremental else "")
+
+    if args.incremental:
+        try:
+            sync_incremental(args, mysql_engine, pg_engine, metrics)
+        finally:
+            record = metrics.finish().as_dict()
+            print(f"Метрики: {format_summary(record)}")
+            export_metrics([record], args.metrics_jsonl, args.metrics_prom)
+        return
+
+    mysql_key, pg_key, group_index = resolve_keys(args, mysql_engine, pg_engine)
+    print(f"Сравниваем ключи: ({', '.join(mysql_key)}) в MySQL и ({', '.join(pg_key)}) в PostgreSQL.")
+    loader = args.loader
+    if loader is None or (loader == "copy" and not copy_supported(pg_engine)):
+        loader = "copy" if copy_supported(pg_engine) else "insert"
+    pg_table = Table(args.table, MetaData(), autoload_with=pg_engine)
+    mysql_columns = {col["name"] for col in inspect(mysql_engine).get_columns(args.table)}
+    columns = [col for col in pg_table.columns if col.name in mysql_columns]
+
+    if args.staging:
+        try:
+            sync_staging(args, mysql_engine, pg_engine, pg_table, columns, mysql_key, pg_key, group_index,
+                         loader, metrics)
+        finally:
+            record = metrics.finish().as_dict()
+            print(f"Метрики: {format_summary(record)}")
+            export_metrics([record], args.metrics_jsonl, args.metrics_prom)
+        return
+
+    # Ключи обеих баз читаются потоково в порядке возрастания и сравниваются слиянием:
+    # недостающие записи обрабатываются по мере обнаружения, без загрузки всех ключей в память
+    if args.key_index:
+        ensure_key_index(pg_engine, args.table, pg_key)
+    diff = KeyDiff(mysql_engine, pg_engine, args.table, mysql_key, pg_key)
+    # Очистка от NUL-символов компилируется один раз по типам столбцов таблицы в PostgreSQL
+    sanitize = build_row_sanitizer(columns)
+
+    # Ключи обрабатываются порциями: один запрос к MySQL и одна транзакция в PostgreSQL на порцию;
+    # с группировкой порция не разрывает группу (отправку формы)
+    key_batches = batch_key_groups(diff.missing(), args.batch_size, group_index)
+    count_inserted = 0
+    with mysql_engine.connect() as mysql_conn, pg_engine.connect() as pg_conn:
+        while True:
+            # Чтение — и сравнение ключей, и выборка строк недостающих ключей из MySQL
+            with metrics.stage("fetch"):
+                batch_started = time.monotonic()
+                batch_keys = next(key_batches, None)
+                rows = batch_keys and fetch_rows_by_keys(mysql_conn, args.table, mysql_key, batch_keys,
+                                                         [col.name for col in columns], group_index)
+            if not batch_keys:
+                break
             if not rows:
-                print(f"Не удалось получить данные для ключа {missing_key} из MySQL.")
+                print(f"Не удалось получить данные для ключей {batch_keys[0]}..{batch_keys[-1]} из MySQL.")
                 continue
-            for row in rows:
-                try:
-                    insert_row_pg(pg_engine, args.table, row)
-                    count_inserted += 1
-                except Exception as e:
-                    print(f"Ошибка при вставке записи с ключом {missing_key} в PostgreSQL: {e}")
-        print(f"\nВставлено {count_inserted} недостающих записей в PostgreSQL.")
+            with metrics.stage("transform"):
+                rows = [sanitize(row) for row in rows]
+            with metrics.stage("write"):
+                count_inserted += insert_batch_pg(pg_conn, pg_table, columns, rows, loader, mysql_key)
+            metrics.add_batch(rows, batch_started)
+            print(f"Найдено недостающих ключей: {diff.missing_count}, вставлено строк: {count_inserted}")
+    record = metrics.finish().as_dict()
+
+    print(f"\nОбщее количество строк в MySQL (по ключам): {diff.source_count}")
+    print(f"Общее количество строк в PostgreSQL (по ключам): {diff.target_count}")
+    print(f"Ключей, которых нет в MySQL, но есть в PostgreSQL: {diff.extra_count}")
+    if diff.missing_count:
+        print(f"\nНайдено {diff.missing_count} недостающих ключей, вставлено {count_inserted} записей в PostgreSQL.")
     else:
         print("Нет недостающих записей для синхронизации.")
+    print(f"Метрики: {format_summary(record)}")
+    export_metrics([record], args.metrics_jsonl, args.metrics_prom)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,17 @@
+# Скрипты миграции лежат в корне репозитория и импортируются тестами как модули.
+# Тесты, которым нужен PostgreSQL, пропускаются, если не задана переменная TEST_POSTGRES_URL,
+# например: TEST_POSTGRES_URL=postgresql+psycopg2://postgres@127.0.0.1:5432/test_db pytest tests
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def pg_url():
+    url = os.environ.get("TEST_POSTGRES_URL")
+    if not url:
+        pytest.skip("не задана переменная TEST_POSTGRES_URL")
+    return url
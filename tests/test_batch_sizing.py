@@ -0,0 +1,50 @@
+# Нарезка потока строк на порции по бюджету в байтах.
+
+from batch_sizing import AdaptiveBatcher
+
+def sizes(batches):
+    return [len(batch) for batch in batches]
+
+def test_batches_close_at_byte_budget():
+    # Строка — 10 байт текста; бюджет 35 байт набирается на четвёртой строке
+    rows = [("x" * 10,) for _ in range(10)]
+    batcher = AdaptiveBatcher(35, max_rows=100, large_value=1000)
+    batches = list(batcher.batches(iter(rows)))
+    assert sizes(batches) == [4, 4, 2]
+    assert [row for batch in batches for row in batch] == rows
+
+def test_row_count_cap():
+    rows = [(i,) for i in range(25)]
+    batcher = AdaptiveBatcher(1 << 20, max_rows=10)
+    assert sizes(batcher.batches(iter(rows))) == [10, 10, 5]
+
+def test_row_larger_than_budget_is_a_batch_of_its_own():
+    big = ("x" * 500,)
+    rows = [("a",), ("b",), big, ("c",)]
+    batcher = AdaptiveBatcher(100, max_rows=100)
+    batches = list(batcher.batches(iter(rows)))
+    assert batches == [[("a",), ("b",)], [big], [("c",)]]
+    assert batcher.large_rows == 1
+
+def test_large_value_threshold_is_quarter_of_budget():
+    rows = [("x" * 24,), ("y" * 25,), ("z" * 24,)]
+    batcher = AdaptiveBatcher(100, max_rows=100)
+    assert sizes(batcher.batches(iter(rows))) == [1, 1, 1]
+    assert batcher.large_rows == 1
+
+def test_limit_follows_average_row_size():
+    batcher = AdaptiveBatcher(1000, max_rows=500, min_rows=5)
+    assert batcher.limit() == 5
+    list(batcher.batches(iter([("x" * 10,)] * 100)))
+    assert batcher.limit() == 100
+
+def test_budget_shrinks_after_slow_write_and_grows_back():
+    batcher = AdaptiveBatcher(1000, max_rows=500, min_rows=1, target_latency=1.0)
+    rows = [("x" * 10,)] * 10
+    batcher.record_write(rows, 4.0)
+    assert batcher.budget == 250
+    batcher.record_write(rows, 0.1)
+    assert batcher.budget == 375
+    for _ in range(5):
+        batcher.record_write(rows, 0.1)
+    assert batcher.budget == 1000
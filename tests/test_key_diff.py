@@ -0,0 +1,55 @@
+# Слияние отсортированных потоков ключей без базы данных.
+
+import pytest
+
+from key_diff import EXTRA, MISSING, KeyDiff, ordered_unique
+
+def merge(source, target):
+    diff = KeyDiff(None, None, "t", ["id"])
+    result = list(diff.merge(iter(source), iter(target)))
+    return diff, result
+
+def test_missing_and_extra_keys():
+    diff, result = merge([(1,), (2,), (4,), (6,)], [(2,), (3,), (4,), (5,)])
+    assert result == [(MISSING, (1,)), (EXTRA, (3,)), (EXTRA, (5,)), (MISSING, (6,))]
+    assert (diff.source_count, diff.target_count) == (4, 4)
+    assert (diff.missing_count, diff.extra_count) == (2, 2)
+
+def test_equal_streams():
+    diff, result = merge([(1,), (2,)], [(1,), (2,)])
+    assert result == []
+    assert (diff.source_count, diff.target_count, diff.missing_count, diff.extra_count) == (2, 2, 0, 0)
+
+def test_one_side_empty():
+    assert merge([(1,), (2,)], [])[1] == [(MISSING, (1,)), (MISSING, (2,))]
+    assert merge([], [(1,)])[1] == [(EXTRA, (1,))]
+    diff, result = merge([], [])
+    assert result == [] and diff.source_count == diff.target_count == 0
+
+def test_composite_keys():
+    source = [(1, "a", 0), (1, "b", 0), (1, "b", 1), (2, "a", 0)]
+    target = [(1, "a", 0), (1, "b", 1), (2, "a", 0), (2, "b", 0)]
+    assert merge(source, target)[1] == [(MISSING, (1, "b", 0)), (EXTRA, (2, "b", 0))]
+
+def test_string_keys_compare_by_code_points():
+    # «Z» (U+005A) меньше «a» (U+0061), как в COLLATE "C" и *_bin
+    assert merge([("Z",), ("a",)], [("a",)])[1] == [(MISSING, ("Z",))]
+
+def test_missing_generator():
+    diff = KeyDiff(None, None, "t", ["id"])
+    merged = diff.merge(iter([(1,), (3,)]), iter([(2,), (3,)]))
+    assert [key for kind, key in merged if kind == MISSING] == [(1,)]
+
+def test_duplicates_are_skipped():
+    assert list(ordered_unique(iter([(1,), (1,), (2,), (2,), (2,), (3,)]), "t")) == [(1,), (2,), (3,)]
+
+def test_out_of_order_keys_raise():
+    with pytest.raises(ValueError, match="не по возрастанию"):
+        list(ordered_unique(iter([(1, "b"), (1, "a")]), "t"))
+
+def test_merge_of_deduplicated_streams():
+    source = ordered_unique(iter([(1,), (1,), (2,)]), "t")
+    target = ordered_unique(iter([(2,), (2,), (3,)]), "t")
+    diff = KeyDiff(None, None, "t", ["id"])
+    assert list(diff.merge(source, target)) == [(MISSING, (1,)), (EXTRA, (3,))]
+    assert (diff.source_count, diff.target_count) == (2, 2)
@@ -0,0 +1,88 @@
+# Кодирование значений в текстовый формат COPY: точные строки для спецсимволов, NULL и типов.
+
+import datetime
+from decimal import Decimal
+
+from sqlalchemy import (Boolean, Column, Date, DateTime, Integer, Interval, JSON, LargeBinary, MetaData,
+                        Numeric, Table, Text)
+
+from pg_copy import COPY_NULL, CopyStream, build_row_encoder, column_encoder, escape_copy_text, format_timedelta
+from sanitize import build_row_sanitizer
+
+def encode(col_type, value):
+    return column_encoder(col_type)(value)
+
+def test_escape_special_characters():
+    assert escape_copy_text("a\\b") == "a\\\\b"
+    assert escape_copy_text("a\tb") == "a\\tb"
+    assert escape_copy_text("a\nb") == "a\\nb"
+    assert escape_copy_text("a\rb") == "a\\rb"
+    assert escape_copy_text("\\\t\n\r") == "\\\\\\t\\n\\r"
+    assert escape_copy_text("обычный текст") == "обычный текст"
+
+def test_escaped_backslash_is_not_escaped_again():
+    # Обратный слеш экранируется первым, иначе \t превратился бы в \\t
+    assert escape_copy_text("\\t") == "\\\\t"
+
+def test_none_is_null_marker():
+    columns = [Column("a", Text), Column("b", Integer), Column("c", LargeBinary)]
+    assert build_row_encoder(columns)((None, None, None)) == "\\N\t\\N\t\\N\n"
+    assert COPY_NULL == "\\N"
+
+def test_null_like_text_is_escaped():
+    # Строка «\N» — это не NULL: обратный слеш удваивается
+    assert encode(Text(), "\\N") == "\\\\N"
+
+def test_bytes_as_bytea_hex():
+    assert encode(LargeBinary(), b"\x00\xff\\\n") == "\\\\x00ff5c0a"
+    assert encode(LargeBinary(), bytearray(b"ab")) == "\\\\x6162"
+    assert encode(LargeBinary(), "я") == "\\\\xd18f"
+
+def test_bool():
+    assert encode(Boolean(), True) == "t"
+    assert encode(Boolean(), False) == "f"
+    assert encode(Boolean(), 2) == "t"
+    assert encode(Text(), True) == "t"
+
+def test_decimal():
+    assert encode(Numeric(10, 2), Decimal("1.50")) == "1.50"
+    assert encode(Numeric(20, 0), Decimal("-18446744073709551615")) == "-18446744073709551615"
+
+def test_temporal():
+    assert encode(DateTime(), datetime.datetime(2024, 1, 2, 3, 4, 5, 6)) == "2024-01-02 03:04:05.000006"
+    assert encode(DateTime(), datetime.datetime(2024, 1, 2, 3, 4, 5)) == "2024-01-02 03:04:05"
+    assert encode(Date(), datetime.date(2024, 1, 2)) == "2024-01-02"
+    assert encode(Interval(), datetime.timedelta(hours=838, seconds=59)) == "838:00:59"
+
+def test_format_negative_timedelta():
+    assert format_timedelta(datetime.timedelta(seconds=-1)) == "-00:00:01"
+    assert format_timedelta(-datetime.timedelta(hours=1, microseconds=500000)) == "-01:00:00.500000"
+
+def test_json():
+    assert encode(JSON(), {"a": "б\n"}) == '{"a": "б\\\\n"}'
+    assert encode(JSON(), b'{"a": 1}') == '{"a": 1}'
+
+def test_set_and_bytes_in_text_column():
+    assert encode(Text(), {"b", "a"}) == "a,b"
+    assert encode(Text(), b"a\tb") == "a\\tb"
+
+def test_nul_is_stripped_before_encoding():
+    columns = [Column("a", Text), Column("b", LargeBinary)]
+    row = build_row_sanitizer(columns)(("a\0b", b"\0"))
+    assert build_row_encoder(columns)(row) == "ab\t\\\\x00\n"
+
+def test_copy_stream_reads_in_blocks():
+    table = Table("t", MetaData(), Column("id", Integer), Column("value", Text))
+    rows = [(i, f"строка\t{i}") for i in range(100)]
+    expected = "".join(f"{i}\tстрока\\t{i}\n" for i in range(100))
+    stream = CopyStream(rows, build_row_encoder(table.columns))
+    blocks = []
+    while True:
+        block = stream.read(64)
+        if not block:
+            break
+        assert len(block) <= 64
+        blocks.append(block)
+    assert "".join(blocks) == expected
+    assert stream.row_count == 100
+    assert CopyStream(rows, build_row_encoder(table.columns)).read() == expected
@@ -0,0 +1,80 @@
+# Передача ошибок стадий и остановка фоновых потоков конвейера.
+
+import itertools
+import threading
+
+import pytest
+
+from pipeline import pipeline
+
+def pipeline_threads():
+    return [thread for thread in threading.enumerate() if thread.name.startswith("pipeline-")]
+
+def test_results_in_order():
+    stages = pipeline(iter(range(20)), lambda chunk: chunk * 10, depth=2)
+    assert [(chunk, result) for chunk, result, started in stages] == [(i, i * 10) for i in range(20)]
+    assert pipeline_threads() == []
+
+def test_sequential_mode():
+    stages = pipeline(iter(range(3)), str, depth=0)
+    assert [(chunk, result) for chunk, result, started in stages] == [(0, "0"), (1, "1"), (2, "2")]
+
+def test_reader_error_reraises_in_consumer():
+    def chunks():
+        yield 1
+        yield 2
+        raise RuntimeError("сбой чтения")
+
+    received = []
+    with pytest.raises(RuntimeError, match="сбой чтения"):
+        for chunk, result, started in pipeline(chunks(), lambda chunk: chunk, depth=1):
+            received.append(chunk)
+    assert received == [1, 2]
+    assert pipeline_threads() == []
+
+def test_transform_error_reraises_in_consumer():
+    closed = threading.Event()
+
+    def chunks():
+        try:
+            yield from itertools.count()
+        finally:
+            closed.set()
+
+    def transform(chunk):
+        if chunk == 3:
+            raise ValueError("сбой очистки")
+        return chunk
+
+    received = []
+    with pytest.raises(ValueError, match="сбой очистки"):
+        for chunk, result, started in pipeline(chunks(), transform, depth=2):
+            received.append(chunk)
+    assert received == [0, 1, 2]
+    assert pipeline_threads() == []
+    # Бесконечный источник остановлен и закрыт в потоке чтения
+    assert closed.is_set()
+
+def test_consumer_error_stops_full_queues():
+    closed = threading.Event()
+
+    def chunks():
+        try:
+            yield from itertools.count()
+        finally:
+            closed.set()
+
+    stages = pipeline(chunks(), lambda chunk: chunk, depth=1)
+    with pytest.raises(KeyError):
+        for chunk, result, started in stages:
+            # Пока запись «медлит», очереди заполнены и потоки ждут свободного места
+            raise KeyError(chunk)
+    stages.close()
+    assert pipeline_threads() == []
+    assert closed.is_set()
+
+def test_early_close_stops_threads():
+    stages = pipeline(itertools.count(), lambda chunk: chunk, depth=2)
+    assert next(stages)[0] == 0
+    stages.close()
+    assert pipeline_threads() == []
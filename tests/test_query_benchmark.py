@@ -0,0 +1,50 @@
+# Разбор файла запросов и перцентили задержки.
+
+from query_benchmark import load_queries, percentile
+
+def test_percentile_nearest_rank():
+    values = [5, 1, 4, 2, 3]
+    assert percentile(values, 50) == 3
+    assert percentile(values, 95) == 5
+    assert percentile(values, 99) == 5
+    assert percentile(values, 0) == 1
+    assert percentile(values, 100) == 5
+
+def test_percentile_of_hundred_values():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+
+def test_percentile_edge_cases():
+    assert percentile([], 50) is None
+    assert percentile([7.5], 99) == 7.5
+
+def test_load_queries(tmp_path):
+    path = tmp_path / "queries.sql"
+    path.write_text(
+        "-- name: by_sid\n"
+        "SELECT *\n"
+        "FROM webform_submission_data\n"
+        "WHERE sid = 1;\n"
+        "\n"
+        "SELECT count(*) FROM webform_submission_data;\n"
+        "-- name: like\n"
+        "SELECT * FROM t WHERE name LIKE 'a%'",
+        encoding="utf-8",
+    )
+    assert load_queries(path) == [
+        ("by_sid", "SELECT *\nFROM webform_submission_data\nWHERE sid = 1"),
+        ("q2", "SELECT count(*) FROM webform_submission_data"),
+        ("like", "SELECT * FROM t WHERE name LIKE 'a%'"),
+    ]
+
+def test_load_queries_comment_inside_query_is_kept(tmp_path):
+    path = tmp_path / "queries.sql"
+    path.write_text("SELECT 1\n-- name: not_a_name\n, 2;\n;\n", encoding="utf-8")
+    assert load_queries(path) == [("q1", "SELECT 1\n-- name: not_a_name\n, 2")]
+
+def test_load_queries_empty_file(tmp_path):
+    path = tmp_path / "queries.sql"
+    path.write_text("\n", encoding="utf-8")
+    assert load_queries(path) == []
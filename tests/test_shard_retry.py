@@ -0,0 +1,85 @@
+# Повтор диапазона после ошибки записи не должен дублировать уже зафиксированные строки.
+
+import pytest
+from sqlalchemy import create_engine, text
+
+import key_ranges
+import migrate_webform_submission_data as migrator
+from checkpoint import ensure_checkpoint_table, clear_checkpoints
+from deferred_indexes import create_table
+
+ROWS = 1000
+
+def make_source(path, primary_key):
+    engine = create_engine(f"sqlite:///{path}")
+    key = " PRIMARY KEY" if primary_key else ""
+    with engine.begin() as conn:
+        conn.execute(text(f"CREATE TABLE shard_retry (id INTEGER{key}, value VARCHAR(32))"))
+        conn.execute(text("INSERT INTO shard_retry (id, value) VALUES (:id, :value)"),
+                     [{"id": i, "value": f"row {i}"} for i in range(ROWS)])
+    return f"sqlite:///{path}"
+
+def prepare_target(pg_url, source_url):
+    engine = create_engine(pg_url)
+    table = migrator.reflect_source_table(create_engine(source_url), "shard_retry", log=lambda *args: None)
+    ensure_checkpoint_table(engine)
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS shard_retry"))
+        clear_checkpoints(conn, "shard_retry")
+        create_table(conn, table)
+    return engine
+
+@pytest.fixture(autouse=True)
+def drop_target(pg_url):
+    """Удаляет таблицу и её журнал после теста, чтобы не оставлять их в тестовой базе."""
+    yield
+    engine = create_engine(pg_url)
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS shard_retry"))
+        clear_checkpoints(conn, "shard_retry")
+    engine.dispose()
+
+def fail_once(monkeypatch, after):
+    """Подменяет запись порций: запись с номером after + 1 один раз завершается ошибкой."""
+    write_chunk = migrator.write_chunk
+    calls = []
+
+    def failing_write_chunk(conn, table, rows, loader):
+        calls.append(len(rows))
+        if len(calls) == after + 1:
+            raise RuntimeError("сбой записи")
+        write_chunk(conn, table, rows, loader)
+
+    monkeypatch.setattr(migrator, "write_chunk", failing_write_chunk)
+    monkeypatch.setattr(key_ranges.time, "sleep", lambda seconds: None)
+    return calls
+
+def run_shard(source_url, pg_url, loader):
+    return migrator.copy_shard(source_url, pg_url, "shard_retry", "id", 100, 900,
+                               chunk_size=100, loader=loader, retries=1)
+
+def check_target(engine):
+    with engine.connect() as conn:
+        count, distinct = conn.execute(text("SELECT count(*), count(DISTINCT id) FROM shard_retry")).one()
+    return count, distinct
+
+def test_keyless_shard_retry_has_no_duplicates(tmp_path, monkeypatch, pg_url):
+    source_url = make_source(tmp_path / "source.db", primary_key=False)
+    engine = prepare_target(pg_url, source_url)
+    calls = fail_once(monkeypatch, after=3)
+    lo, hi, rows, elapsed, error, record = run_shard(source_url, pg_url, "copy")
+    assert error is None
+    assert len(calls) > 4
+    assert rows == 800
+    assert check_target(engine) == (800, 800)
+
+def test_keyed_shard_retry_continues_from_checkpoint(tmp_path, monkeypatch, pg_url):
+    source_url = make_source(tmp_path / "source.db", primary_key=True)
+    engine = prepare_target(pg_url, source_url)
+    calls = fail_once(monkeypatch, after=3)
+    lo, hi, rows, elapsed, error, record = run_shard(source_url, pg_url, "insert")
+    assert error is None
+    # Три порции зафиксированы до сбоя, повтор переносит только оставшиеся пять
+    assert len(calls) == 3 + 1 + 5
+    assert rows == 800
+    assert check_target(engine) == (800, 800)
@@ -0,0 +1,76 @@
+# Группировка ключей, деление на диапазоны и изоляция ошибочных строк при досинхронизации.
+
+from contextlib import contextmanager
+
+from sqlalchemy import Column, Integer, MetaData, Table, Text
+
+from sync_webform_submission_data import batch_key_groups, group_first, insert_batch_pg, split_key_runs
+
+class FakeConnection:
+    """Соединение, которое отклоняет транзакцию, если в ней есть строка с value == "bad"."""
+
+    def __init__(self):
+        self.committed = []
+        self.transactions = 0
+        self._pending = None
+
+    @contextmanager
+    def begin(self):
+        self.transactions += 1
+        self._pending = []
+        yield self
+        self.committed.extend(self._pending)
+
+    def execute(self, statement, rows):
+        if any(row["value"] == "bad" for row in rows):
+            raise ValueError("bad row")
+        self._pending.extend(rows)
+
+def test_split_key_runs_at_gaps():
+    keys = list(range(1, 21)) + [25] + list(range(30, 46)) + [50, 51]
+    runs, singles = split_key_runs(keys, min_run=16)
+    assert runs == [(1, 20), (30, 45)]
+    assert singles == [25, 50, 51]
+
+def test_split_key_runs_short_runs_are_singles():
+    assert split_key_runs([1, 2, 3, 7, 8], min_run=4) == ([], [1, 2, 3, 7, 8])
+    assert split_key_runs([], min_run=4) == ([], [])
+
+def test_split_key_runs_non_integer_keys():
+    assert split_key_runs(["a", "b", "c"], min_run=2) == ([], ["a", "b", "c"])
+
+def test_batch_key_groups_by_size():
+    keys = [(i,) for i in range(7)]
+    assert [len(batch) for batch in batch_key_groups(keys, 3)] == [3, 3, 1]
+
+def test_batch_key_groups_keeps_groups_whole():
+    # Группа sid=2 не разрывается, хотя порция уже набрала batch_size ключей
+    keys = [(1, "a"), (1, "b"), (2, "a"), (2, "b"), (2, "c"), (3, "a")]
+    batches = list(batch_key_groups(keys, 3, group_index=0))
+    assert batches == [[(1, "a"), (1, "b"), (2, "a"), (2, "b"), (2, "c")], [(3, "a")]]
+
+def test_batch_key_groups_large_group_is_one_batch():
+    keys = [(1, i) for i in range(10)] + [(2, 0)]
+    assert [len(batch) for batch in batch_key_groups(keys, 3, group_index=0)] == [10, 1]
+
+def test_group_first():
+    assert group_first(["name", "sid"], ["n", "s"], "sid") == (["sid", "name"], ["s", "n"], 0)
+    assert group_first(["name", "sid"], ["n", "s"], None) == (["name", "sid"], ["n", "s"], None)
+    assert group_first(["name"], ["n"], "sid") == (["name"], ["n"], None)
+
+def test_insert_batch_isolates_single_bad_row(capsys):
+    table = Table("t", MetaData(), Column("id", Integer, primary_key=True), Column("value", Text))
+    rows = [(i, "bad" if i == 5 else f"row {i}") for i in range(16)]
+    conn = FakeConnection()
+    inserted = insert_batch_pg(conn, table, list(table.columns), rows, "insert", ["id"])
+    assert inserted == 15
+    assert sorted(row["id"] for row in conn.committed) == [i for i in range(16) if i != 5]
+    # Деление пополам: 5 неудачных транзакций (16, 8, 4, 2, 1 строка) и 4 удачные половины
+    assert conn.transactions == 9
+    assert "(5,)" in capsys.readouterr().out
+
+def test_insert_batch_without_errors_is_one_transaction():
+    table = Table("t", MetaData(), Column("id", Integer, primary_key=True), Column("value", Text))
+    conn = FakeConnection()
+    assert insert_batch_pg(conn, table, list(table.columns), [(1, "a"), (2, "b")], "insert", ["id"]) == 2
+    assert conn.transactions == 1
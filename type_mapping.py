@@ -0,0 +1,177 @@
+# Отображение схемы MySQL на PostgreSQL по метаданным, отражённым SQLAlchemy.
+# Схема всех таблиц читается одним проходом MetaData.reflect, а таблицы в PostgreSQL создаются
+# с точными типами, NOT NULL, первичными ключами и индексами, а не по типам, выведенным из данных.
+
+import re
+
+from sqlalchemy import Column, ForeignKeyConstraint, Identity, Index, MetaData, Table, func, text
+from sqlalchemy import types as sqltypes
+from sqlalchemy.dialects import mysql
+from sqlalchemy.dialects.postgresql import JSONB
+
+PG_MAX_IDENTIFIER = 63
+
+_ZERO_DATE = re.compile(r"^'?0000-00-00")
+_NUMBER = re.compile(r"^'?-?\d+(\.\d+)?'?$")
+_CURRENT_TIMESTAMP = re.compile(r"^(current_timestamp|now)(\(\d*\))?$", re.IGNORECASE)
+
+def _map_integer(col_type, tinyint_as_boolean):
+    unsigned = getattr(col_type, "unsigned", False)
+    if isinstance(col_type, mysql.TINYINT):
+        # TINYINT(1) — принятое в MySQL представление BOOLEAN
+        if tinyint_as_boolean and col_type.display_width == 1:
+            return sqltypes.Boolean()
+        return sqltypes.SmallInteger()
+    if isinstance(col_type, sqltypes.SmallInteger):
+        return sqltypes.Integer() if unsigned else sqltypes.SmallInteger()
+    if isinstance(col_type, mysql.MEDIUMINT):
+        return sqltypes.Integer()
+    if isinstance(col_type, sqltypes.BigInteger):
+        # BIGINT UNSIGNED не помещается в bigint
+        return sqltypes.Numeric(20, 0) if unsigned else sqltypes.BigInteger()
+    return sqltypes.BigInteger() if unsigned else sqltypes.Integer()
+
+def _map_string(col_type):
+    # Кодировка binary означает байтовые строки; collation MySQL в PostgreSQL не переносится
+    if getattr(col_type, "charset", None) == "binary":
+        return sqltypes.LargeBinary()
+    if isinstance(col_type, sqltypes.Text) or col_type.length is None:
+        return sqltypes.Text()
+    if isinstance(col_type, sqltypes.CHAR):
+        return sqltypes.CHAR(col_type.length)
+    return sqltypes.String(col_type.length)
+
+def map_type(col_type, tinyint_as_boolean=True):
+    """Возвращает тип SQLAlchemy для PostgreSQL, соответствующий отражённому типу MySQL."""
+    if isinstance(col_type, sqltypes.TypeDecorator):
+        col_type = col_type.impl_instance
+    if isinstance(col_type, sqltypes.Boolean):
+        return sqltypes.Boolean()
+    if isinstance(col_type, sqltypes.Integer):
+        return _map_integer(col_type, tinyint_as_boolean)
+    if isinstance(col_type, mysql.YEAR):
+        return sqltypes.SmallInteger()
+    if isinstance(col_type, mysql.BIT):
+        # pymysql возвращает BIT(n) байтами, они переносятся в bytea без изменений
+        return sqltypes.LargeBinary()
+    if isinstance(col_type, sqltypes.Enum):
+        return sqltypes.String(max((len(value) for value in col_type.enums), default=1))
+    if isinstance(col_type, mysql.SET):
+        return sqltypes.Text()
+    if isinstance(col_type, sqltypes._Binary):
+        return sqltypes.LargeBinary()
+    if isinstance(col_type, sqltypes.String):
+        return _map_string(col_type)
+    if isinstance(col_type, (sqltypes.Double, mysql.REAL)):
+        return sqltypes.Double()
+    if isinstance(col_type, sqltypes.Float):
+        return sqltypes.REAL()
+    if isinstance(col_type, sqltypes.Numeric):
+        return sqltypes.Numeric(col_type.precision, col_type.scale)
+    if isinstance(col_type, sqltypes.DateTime):
+        return sqltypes.DateTime()
+    if isinstance(col_type, sqltypes.Date):
+        return sqltypes.Date()
+    if isinstance(col_type, sqltypes.Time):
+        # MySQL TIME — промежуток до ±838 часов (pymysql возвращает timedelta), time его не вмещает
+        return sqltypes.Interval()
+    if isinstance(col_type, sqltypes.JSON):
+        return JSONB()
+    try:
+        return col_type.as_generic()
+    except NotImplementedError:
+        return sqltypes.Text()
+
+def _default_text(column):
+    default = column.server_default
+    if default is None or not hasattr(default, "arg"):
+        return None
+    arg = default.arg
+    return (arg.text if hasattr(arg, "text") else str(arg)).strip()
+
+def _map_default(value, target_type):
+    """Переносит простые значения по умолчанию (числа, строки, CURRENT_TIMESTAMP);
+    выражения MySQL и нулевые даты отбрасываются."""
+    if value is None or value.upper() == "NULL" or _ZERO_DATE.match(value):
+        return None
+    if isinstance(target_type, sqltypes.Boolean):
+        number = value.strip("'")
+        return text("false" if int(number) == 0 else "true") if number.isdigit() else None
+    if _CURRENT_TIMESTAMP.match(value):
+        return text("CURRENT_TIMESTAMP") if isinstance(target_type, (sqltypes.DateTime, sqltypes.Date)) else None
+    if _NUMBER.match(value) or (len(value) > 1 and value.startswith("'") and value.endswith("'")):
+        return text(value)
+    return None
+
+def map_column(column, tinyint_as_boolean=True):
+    """Строит столбец PostgreSQL по отражённому столбцу MySQL."""
+    target_type = map_type(column.type, tinyint_as_boolean)
+    default = _default_text(column)
+    autoincrement = column.autoincrement is True
+    if autoincrement and not isinstance(target_type, sqltypes.Integer):
+        # AUTO_INCREMENT на BIGINT UNSIGNED: последовательности PostgreSQL — bigint
+        target_type = sqltypes.BigInteger()
+    # Столбцы NOT NULL DEFAULT '0000-00-00' хранят нулевые даты, которые переносятся как NULL
+    nullable = column.nullable or bool(default and _ZERO_DATE.match(default))
+    if autoincrement:
+        # IDENTITY (а не SERIAL) сохраняет последовательность и у таблицы без первичного ключа,
+        # например при отложенном построении ключей; BY DEFAULT допускает перенос значений из MySQL
+        return Column(column.name, target_type, Identity(), nullable=nullable,
+                      primary_key=column.primary_key, comment=column.comment)
+    return Column(column.name, target_type, nullable=nullable, primary_key=column.primary_key,
+                  autoincrement=False, server_default=_map_default(default, target_type),
+                  comment=column.comment)
+
+def index_name(table_name, name):
+    """Имя индекса в PostgreSQL. Имена индексов там уникальны в пределах схемы, а не таблицы,
+    поэтому к имени из MySQL добавляется имя таблицы."""
+    return f"{table_name}_{name}"[:PG_MAX_IDENTIFIER]
+
+def map_table(source, metadata, tinyint_as_boolean=True, log=print):
+    """Строит в metadata таблицу PostgreSQL по отражённой таблице MySQL: столбцы, первичный ключ
+    и индексы (префиксные индексы MySQL — индексы по left(столбец, n)). Индексы FULLTEXT и SPATIAL
+    не переносятся: в btree они не помещаются, а поиск по ним в PostgreSQL устроен иначе
+    (tsvector, PostGIS), поэтому о них только сообщается. Внешние ключи добавляет
+    build_target_metadata, когда известны все переносимые таблицы."""
+    target = Table(source.name, metadata, *[map_column(col, tinyint_as_boolean) for col in source.columns])
+    for index in source.indexes:
+        kind = index.dialect_options["mysql"]["prefix"]
+        if kind in ("FULLTEXT", "SPATIAL"):
+            columns = ", ".join(col.name for col in index.columns)
+            log(f"Индекс {kind} '{index.name}' таблицы '{source.name}' ({columns}) не переносится.")
+            continue
+        lengths = index.dialect_options["mysql"]["length"]
+        expressions = []
+        for col in index.columns:
+            length = lengths.get(col.name) if isinstance(lengths, dict) else lengths
+            expressions.append(func.left(target.c[col.name], length) if length else target.c[col.name])
+        Index(index_name(source.name, index.name), *expressions, unique=index.unique)
+    return target
+
+def reflect_source_tables(engine, tables=None):
+    """Отражает схему таблиц MySQL (всех или перечисленных) одним проходом: столбцы, ключи
+    и индексы всех таблиц читаются пакетными запросами к information_schema."""
+    metadata = MetaData()
+    metadata.reflect(bind=engine, only=tables, resolve_fks=False)
+    return metadata
+
+def _map_foreign_keys(source, target, metadata):
+    """Добавляет к target внешние ключи source, ссылающиеся на таблицы из metadata."""
+    for fk in source.foreign_key_constraints:
+        referred = [element.target_fullname.rsplit(".", 1) for element in fk.elements]
+        if referred[0][0] not in metadata.tables:
+            continue
+        target.append_constraint(ForeignKeyConstraint(
+            fk.column_keys, [f"{table}.{name}" for table, name in referred],
+            name=fk.name, ondelete=fk.ondelete, onupdate=fk.onupdate,
+        ))
+
+def build_target_metadata(source_metadata, tinyint_as_boolean=True, log=print):
+    """Возвращает MetaData с таблицами PostgreSQL для всех таблиц source_metadata.
+    Внешние ключи переносятся только между таблицами из source_metadata."""
+    metadata = MetaData()
+    for table in source_metadata.tables.values():
+        map_table(table, metadata, tinyint_as_boolean, log)
+    for table in source_metadata.tables.values():
+        _map_foreign_keys(table, metadata.tables[table.name], metadata)
+    return metadata